@@ -1,11 +1,17 @@
 import math
 import unittest
 import os
+import tempfile
 from itertools import takewhile, chain
 from functional import seq
 from fn import _
 from fn.iters import iterate as fn_iterate
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 def compute_module_fuel(module_mass):
     fuel = math.floor((module_mass / 3)) - 2
@@ -40,9 +46,13 @@ def compute_sum_of_module_fuel_realistic():
     return fuel_sum
 
 
-def get_file_contents():
+def get_file_path():
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    file_path = os.path.join(dir_path, "..", "data", "d1.txt")
+    return os.path.join(dir_path, "..", "data", "d1.txt")
+
+
+def get_file_contents():
+    file_path = get_file_path()
     with open(file_path, "r") as f:
         lines = f.readlines()
         lines = [l.strip() for l in lines]
@@ -85,6 +95,128 @@ def module_fuel_overall_2():
     return r
 
 
+def read_module_mass_chunks(file_path=None, chunk_size=1 << 24):
+    # Yields int64 arrays of masses, reading at most chunk_size bytes at a
+    # time. A number cut by the chunk boundary is carried over to the next
+    # chunk.
+    if file_path is None:
+        file_path = get_file_path()
+    with open(file_path, "rb") as f:
+        remainder = b""
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = remainder + block
+            last_separator = max(block.rfind(b"\n"), block.rfind(b" "))
+            if last_separator == -1:
+                remainder = block
+                continue
+            remainder = block[last_separator + 1:]
+            # fromstring parses blank text as a single 0 mass.
+            masses = block[:last_separator + 1]
+            if masses.strip():
+                yield np.fromstring(masses.decode(), dtype=np.int64, sep=" ")
+        if remainder.strip():
+            yield np.fromstring(remainder.decode(), dtype=np.int64, sep=" ")
+
+
+def sum_module_fuel_vectorized(masses, realistic=False):
+    fuel = masses // 3 - 2
+    total_fuel = int(fuel.sum())
+    if not realistic:
+        return total_fuel
+
+    # Only modules which still need fuel for their fuel stay in the array.
+    fuel = fuel[fuel > 0]
+    while fuel.size:
+        fuel = fuel // 3 - 2
+        fuel = fuel[fuel > 0]
+        total_fuel += int(fuel.sum())
+    return total_fuel
+
+
+def compute_sum_of_module_fuel_vectorized(realistic=False, file_path=None, chunk_size=1 << 24):
+    return sum(sum_module_fuel_vectorized(masses, realistic)
+               for masses in read_module_mass_chunks(file_path, chunk_size))
+
+
+def build_fuel_of_fuel_table(bound):
+    # table[x] is the fuel needed to carry x units of fuel, for 0 <= x <= bound.
+    # Fuel for x only depends on fuel for x // 3 - 2, so the table is filled
+    # in blocks whose entries only refer to already computed ones.
+    table = np.zeros(bound + 1, dtype=np.int64)
+    computed = 9  # x < 9 needs no extra fuel.
+    while computed <= bound:
+        end = min(bound + 1, 3 * computed + 6)
+        fuel = np.arange(computed, end, dtype=np.int64) // 3 - 2
+        table[computed:end] = fuel + table[fuel]
+        computed = end
+    return table
+
+
+def load_fuel_of_fuel_table(bound=1 << 20, cache_path=None):
+    if cache_path is None:
+        cache_path = os.path.join(tempfile.gettempdir(), "p1_fuel_of_fuel_{}.npy".format(bound))
+    try:
+        table = np.load(cache_path)
+    except (OSError, ValueError, EOFError):
+        # Missing, truncated or not an array file, rebuilt below.
+        table = None
+    if table is not None and is_fuel_of_fuel_table(table, bound):
+        return table
+
+    table = build_fuel_of_fuel_table(bound)
+    # Written next to the cache and renamed over it, so other readers never
+    # see a partially written table.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, table)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return table
+
+
+def is_fuel_of_fuel_table(table, bound, samples=64):
+    # Spot checks a cached table against the scalar computation.
+    if not isinstance(table, np.ndarray) or table.shape != (bound + 1,) or table.dtype != np.int64:
+        return False
+    for x in np.unique(np.linspace(0, bound, samples, dtype=np.int64)).tolist() + [min(9, bound)]:
+        if table[x] != max(compute_module_fuel_realistic(x), 0):
+            return False
+    return True
+
+
+def sum_module_fuel_table(masses, table):
+    bound = len(table) - 1
+    fuel = masses // 3 - 2
+    total_fuel = int(fuel.sum())
+
+    # Masses above the table bound take a few explicit steps until their
+    # fuel fits into the table.
+    large_fuel = fuel[fuel > bound]
+    while large_fuel.size:
+        large_fuel = large_fuel // 3 - 2
+        # With a small bound the steps reach fuel which needs nothing more.
+        large_fuel = large_fuel[large_fuel > 0]
+        total_fuel += int(large_fuel.sum())
+        small_fuel = large_fuel[large_fuel <= bound]
+        total_fuel += int(table[small_fuel].sum())
+        large_fuel = large_fuel[large_fuel > bound]
+
+    fuel = fuel[(fuel > 0) & (fuel <= bound)]
+    return total_fuel + int(table[fuel].sum())
+
+
+def compute_sum_of_module_fuel_table(bound=1 << 20, file_path=None, chunk_size=1 << 24, cache_path=None):
+    table = load_fuel_of_fuel_table(bound, cache_path)
+    return sum(sum_module_fuel_table(masses, table)
+               for masses in read_module_mass_chunks(file_path, chunk_size))
+
+
 class Tests(unittest.TestCase):
     def test_fuel(self):
         self.assertEqual(compute_module_fuel(12), 2)
@@ -97,6 +229,62 @@ class Tests(unittest.TestCase):
         self.assertEqual(compute_module_fuel_realistic(1969), 966)
         self.assertEqual(compute_module_fuel_realistic(100756), 50346)
 
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_fuel_vectorized(self):
+        masses = [1, 12, 14, 1969, 100756]
+        self.assertEqual(sum_module_fuel_vectorized(np.array(masses, dtype=np.int64)),
+                         sum(compute_module_fuel(m) for m in masses))
+        self.assertEqual(sum_module_fuel_vectorized(np.array(masses, dtype=np.int64), realistic=True),
+                         sum(compute_module_fuel_realistic(m) for m in masses))
+
+        file_path = get_file_path()
+        for chunk_size in (7, 64, 1 << 24):
+            self.assertEqual(compute_sum_of_module_fuel_vectorized(file_path=file_path, chunk_size=chunk_size),
+                             compute_sum_of_module_fuel())
+            self.assertEqual(compute_sum_of_module_fuel_vectorized(realistic=True, file_path=file_path,
+                                                                  chunk_size=chunk_size),
+                             compute_sum_of_module_fuel_realistic())
+
+        # Chunks made only of blank lines yield no masses.
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "d1.txt")
+            with open(file_path, "wb") as f:
+                f.write(b"12\n\n\n14\n")
+            for chunk_size in (1, 2, 3, 1 << 24):
+                self.assertEqual(compute_sum_of_module_fuel_vectorized(file_path=file_path, chunk_size=chunk_size), 4)
+            with open(file_path, "wb") as f:
+                f.write(b"\n\n\n")
+            for chunk_size in (1, 2, 1 << 24):
+                self.assertEqual(compute_sum_of_module_fuel_vectorized(file_path=file_path, chunk_size=chunk_size), 0)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_fuel_table(self):
+        table = build_fuel_of_fuel_table(1000)
+        self.assertEqual([int(table[x]) for x in range(1001)],
+                         [max(compute_module_fuel_realistic(x), 0) for x in range(1001)])
+
+        masses = [1, 12, 14, 1969, 100756, 10 ** 12]
+        for bound in (0, 1, 2, 7, 8, 10, 1000, 1 << 20):
+            self.assertEqual(sum_module_fuel_table(np.array(masses, dtype=np.int64), build_fuel_of_fuel_table(bound)),
+                             sum(compute_module_fuel_realistic(m) for m in masses))
+        self.assertEqual(sum_module_fuel_table(np.array([100, 33, 1969], dtype=np.int64), build_fuel_of_fuel_table(2)),
+                         1015)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = os.path.join(temp_dir, "table.npy")
+            for _ in range(2):
+                self.assertEqual(compute_sum_of_module_fuel_table(bound=5000, cache_path=cache_path),
+                                 compute_sum_of_module_fuel_realistic())
+
+            # Broken or wrong caches are rebuilt instead of trusted.
+            with open(cache_path, "wb") as f:
+                f.write(b"garbage")
+            self.assertEqual(load_fuel_of_fuel_table(5000, cache_path)[9], 1)
+            np.save(cache_path, np.arange(5001, dtype=np.int64))
+            self.assertEqual(list(load_fuel_of_fuel_table(5000, cache_path)), list(build_fuel_of_fuel_table(5000)))
+            self.assertTrue(is_fuel_of_fuel_table(np.load(cache_path), 5000))
+            self.assertEqual(os.listdir(temp_dir), ["table.npy"])
+
 
 if __name__ == '__main__':
     print(module_fuel())
@@ -105,4 +293,6 @@ if __name__ == '__main__':
     print(module_fuel_overall())
     print(module_fuel_overall_2())
     print(compute_sum_of_module_fuel_realistic())
+    if np is not None:
+        print(compute_sum_of_module_fuel_vectorized(realistic=True))
     unittest.main()
@@ -3,6 +3,15 @@ import os
 import heapq
 import math
 import collections
+import array
+import functools
+import concurrent.futures
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def get_file_contents() -> str:
@@ -13,19 +22,21 @@ def get_file_contents() -> str:
     return lines
 
 
+# Translates a map line into its occupancy bytes, 1 for an asteroid.
+occupancy_table = bytes(1 if chr(i) == "#" else 0 for i in range(256))
+
+
 class Map(object):
+    # Occupancy is a row-major bytearray, one byte per cell. Rows shorter
+    # than the widest one are padded with empty space.
     def __init__(self, map_str: str):
-        self.m = []
-        self.d = {}
-
-        lines = map_str.strip().splitlines()
+        lines = [line.strip() for line in map_str.strip().splitlines()]
         self.r = len(lines)
-        self.c = len(lines[0])
+        self.c = max((len(line) for line in lines), default=0)
+        self.bitmap = bytearray(self.r * self.c)
         for r, line in enumerate(lines):
-            for c, ch in enumerate(line.strip()):
-                self.m.append(ch)
-                if ch == "#":
-                    self.d[(c, r)] = c, r
+            row = line.ljust(self.c, ".").encode().translate(occupancy_table)
+            self.bitmap[r * self.c:(r + 1) * self.c] = row
 
     def __str__(self):
         s = ""
@@ -36,7 +47,35 @@ class Map(object):
         return s
 
     def get(self, r, c):
-        return self.m[r * self.c + c]
+        return "#" if self.bitmap[r * self.c + c] else "."
+
+    def occupied(self, p) -> bool:
+        c, r = p
+        return 0 <= c < self.c and 0 <= r < self.r and self.bitmap[r * self.c + c] == 1
+
+    def points(self):
+        # Asteroid coordinates as (x, y), in row-major order.
+        points = []
+        i = self.bitmap.find(1)
+        while i != -1:
+            points.append((i % self.c, i // self.c))
+            i = self.bitmap.find(1, i + 1)
+        return points
+
+    def line_of_sight(self, origin_point, p) -> bool:
+        # Steps along the gcd-reduced direction and tests every cell between
+        # the two points.
+        step_x, step_y = direction_key(origin_point, p)
+        x, y = origin_point[0] + step_x, origin_point[1] + step_y
+        while (x, y) != p:
+            if self.bitmap[y * self.c + x]:
+                return False
+            x += step_x
+            y += step_y
+        return True
+
+    def count_visible(self, origin_point) -> int:
+        return sum(1 for p in self.points() if p != origin_point and self.line_of_sight(origin_point, p))
 
 
 def unit_vector(v):
@@ -66,13 +105,14 @@ def solve(map_str: str):
     max_sighted = 0
     chosen_coords = None
 
-    for origin_point in m.d.keys():
+    points = m.points()
+    for origin_point in points:
         sighted = set()
         sighted_ordered = []
         directions = []
         p_queue = []
 
-        for p in m.d.keys():
+        for p in points:
             if p != origin_point:
                 heapq.heappush(p_queue, [dist(origin_point, p), p])
 
@@ -94,6 +134,129 @@ def solve(map_str: str):
     return max_sighted, chosen_coords
 
 
+def direction_key(origin_point, p):
+    # Offsets reduced by their gcd are equal exactly when two asteroids lie
+    # on the same ray from the origin.
+    dx = p[0] - origin_point[0]
+    dy = p[1] - origin_point[1]
+    g = math.gcd(dx, dy)
+    return dx // g, dy // g
+
+
+def count_visible(origin_point, points) -> int:
+    return len({direction_key(origin_point, p) for p in points if p != origin_point})
+
+
+def solve_exact(map_str: str):
+    m = Map(map_str)
+
+    max_sighted = 0
+    chosen_coords = None
+    points = m.points()
+    for origin_point in points:
+        sighted = count_visible(origin_point, points)
+        if sighted > max_sighted:
+            max_sighted = sighted
+            chosen_coords = origin_point
+
+    return max_sighted, chosen_coords
+
+
+def visibility_counts_numpy(points, tile_elements: int = 1 << 22):
+    # Visible asteroid count for every origin. Origins are processed in tiles
+    # of rows against all asteroids, so at most about tile_elements pairs
+    # are held at once.
+    coords = np.array(points, dtype=np.int64).reshape(-1, 2)
+    count = len(coords)
+    xs, ys = coords[:, 0], coords[:, 1]
+    x_range = int(xs.max() - xs.min()) if count else 0
+    y_range = int(ys.max() - ys.min()) if count else 0
+
+    counts = np.zeros(count, dtype=np.int64)
+    tile_rows = max(1, tile_elements // max(count, 1))
+    for start in range(0, count, tile_rows):
+        end = min(count, start + tile_rows)
+        dx = xs[np.newaxis, :] - xs[start:end, np.newaxis]
+        dy = ys[np.newaxis, :] - ys[start:end, np.newaxis]
+        g = np.gcd(dx, dy)
+        is_origin = g == 0
+        g[is_origin] = 1
+        # Pack the reduced direction into one non-negative key per pair, the
+        # origin itself gets -1.
+        keys = (dx // g + x_range) * (2 * y_range + 1) + (dy // g + y_range)
+        keys[is_origin] = -1
+        keys.sort(axis=1)
+        # Distinct keys minus the origin's own -1.
+        counts[start:end] = np.count_nonzero(np.diff(keys, axis=1), axis=1)
+    return counts
+
+
+def solve_numpy(map_str: str, tile_elements: int = 1 << 22):
+    m = Map(map_str)
+    points = m.points()
+    if not points:
+        return 0, None
+    counts = visibility_counts_numpy(points, tile_elements)
+    best = int(np.argmax(counts))
+    if counts[best] == 0:
+        # Same as solve, a lone asteroid is no station.
+        return 0, None
+    return int(counts[best]), points[best]
+
+
+_worker_points = []
+
+
+def _init_visibility_worker(shared_memory_name: str, point_count: int):
+    global _worker_points
+    shared_coords = shared_memory.SharedMemory(name=shared_memory_name)
+    coords = shared_coords.buf[:point_count * 2 * 8].cast("q")
+    _worker_points = [(coords[2 * i], coords[2 * i + 1]) for i in range(point_count)]
+    coords.release()
+    shared_coords.close()
+
+
+def _count_visible_shard(start: int, end: int):
+    return start, [count_visible(_worker_points[i], _worker_points) for i in range(start, end)]
+
+
+def solve_parallel(map_str: str, processes=None, shard_size=None):
+    # Origins are sharded across worker processes. The coordinates are
+    # placed in shared memory once, each worker reads them when it starts
+    # and only sends back the counts of its shards.
+    m = Map(map_str)
+    points = m.points()
+    if not points:
+        return 0, None
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if shard_size is None:
+        shard_size = max(1, len(points) // (processes * 4))
+
+    coords = array.array("q", [c for p in points for c in p])
+    shared_coords = shared_memory.SharedMemory(create=True, size=max(1, len(coords) * coords.itemsize))
+    try:
+        shared_coords.buf[:len(coords) * coords.itemsize] = coords.tobytes()
+        counts = [0] * len(points)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                    initializer=_init_visibility_worker,
+                                                    initargs=(shared_coords.name, len(points))) as executor:
+            shards = [executor.submit(_count_visible_shard, start, min(len(points), start + shard_size))
+                      for start in range(0, len(points), shard_size)]
+            for shard in concurrent.futures.as_completed(shards):
+                start, shard_counts = shard.result()
+                counts[start:start + len(shard_counts)] = shard_counts
+    finally:
+        shared_coords.close()
+        shared_coords.unlink()
+
+    best = max(range(len(points)), key=lambda i: (counts[i], -i))
+    if counts[best] == 0:
+        return 0, None
+    return counts[best], points[best]
+
+
 def angle(u1, u2):
     u1_a = math.atan2(u1[1], u1[0])
     u2_a = math.atan2(u2[1], u2[0])
@@ -108,7 +271,7 @@ def vaporize(map_str: str, starting_point=None, interested_asteroid=None):
     if starting_point:
         origin_point = starting_point
     else:
-        max_seen, origin_point = solve(map_str)
+        max_seen, origin_point = solve_exact(map_str)
         print(max_seen, origin_point)
 
     m = Map(map_str)
@@ -116,7 +279,7 @@ def vaporize(map_str: str, starting_point=None, interested_asteroid=None):
     up = (0, -1)
 
     angle_distance_and_coords = []
-    for p in m.d.keys():
+    for p in m.points():
         if p != origin_point:
             direction = unit_vector_direction(origin_point, p)
             distance = dist(origin_point, p)
@@ -156,16 +319,62 @@ def vaporize(map_str: str, starting_point=None, interested_asteroid=None):
     return interested_asteroid_coords
 
 
+def clockwise_from_up(a, b) -> int:
+    # Compares two directions by their clockwise angle from up, where y grows
+    # downwards. The first half turn holds up and everything right of it.
+    a_half = 0 if a[0] > 0 or (a[0] == 0 and a[1] < 0) else 1
+    b_half = 0 if b[0] > 0 or (b[0] == 0 and b[1] < 0) else 1
+    if a_half != b_half:
+        return a_half - b_half
+    cross = a[0] * b[1] - a[1] * b[0]
+    return -1 if cross > 0 else (1 if cross < 0 else 0)
+
+
+def vaporization_order(points, origin_point):
+    # Asteroids on one ray form a bucket, nearest first. Each rotation takes
+    # the next asteroid of every bucket which still has one, in angle order.
+    buckets = collections.defaultdict(list)
+    for p in points:
+        if p != origin_point:
+            buckets[direction_key(origin_point, p)].append(p)
+
+    active = []
+    for key in sorted(buckets, key=functools.cmp_to_key(clockwise_from_up)):
+        bucket = buckets[key]
+        bucket.sort(key=lambda p: dist(origin_point, p))
+        active.append(bucket)
+
+    order = []
+    rotation = 0
+    while active:
+        order.extend(bucket[rotation] for bucket in active)
+        rotation += 1
+        active = [bucket for bucket in active if len(bucket) > rotation]
+    return order
+
+
+def find_vaporized(map_str: str, asteroid_numbers, starting_point=None):
+    # Coordinates of the n-th vaporized asteroid (1-based) for every n, None
+    # for n past the last one.
+    if starting_point:
+        origin_point = starting_point
+    else:
+        _, origin_point = solve_exact(map_str)
+
+    order = vaporization_order(Map(map_str).points(), origin_point)
+    return [order[n - 1] if 0 < n <= len(order) else None for n in asteroid_numbers]
+
+
 def part1():
     input_map = get_file_contents()
-    r, _ = solve(input_map)
+    r, _ = solve_exact(input_map)
     print(r)
     assert r == 347
 
 
 def part2():
     input_map = get_file_contents()
-    interested_asteroid_coords = vaporize(input_map, interested_asteroid=200)
+    interested_asteroid_coords, = find_vaporized(input_map, [200])
     print(">> interested asteroid number: {} coords: {}".format(200, interested_asteroid_coords))
     final_result = interested_asteroid_coords[0] * 100 + interested_asteroid_coords[1]
     print(final_result)
@@ -176,8 +385,48 @@ class Tests(unittest.TestCase):
         max_sighted, station_coords = solve(map_str)
         print(station_coords)
         self.assertEqual(max_sighted, expected_sighted)
+        self.assertEqual(solve_exact(map_str), (max_sighted, station_coords))
+        if np is not None:
+            self.assertEqual(solve_numpy(map_str), (max_sighted, station_coords))
+            self.assertEqual(solve_numpy(map_str, tile_elements=64), (max_sighted, station_coords))
+
+    def test_map(self):
+        m = Map("""
+.#..#
+.....
+#####
+....#
+...##""")
+        self.assertEqual(len(m.bitmap), 25)
+        self.assertEqual(m.points(), [(1, 0), (4, 0), (0, 2), (1, 2), (2, 2), (3, 2), (4, 2), (4, 3), (3, 4),
+                                      (4, 4)])
+        self.assertTrue(m.occupied((3, 4)))
+        self.assertFalse(m.occupied((0, 0)))
+        self.assertFalse(m.occupied((5, 0)))
+        self.assertTrue(m.line_of_sight((3, 4), (4, 0)))
+        # (2, 2) sits between them.
+        self.assertFalse(m.line_of_sight((3, 4), (1, 0)))
+        self.assertFalse(m.line_of_sight((4, 0), (4, 4)))
+        self.assertEqual(m.count_visible((3, 4)), 8)
+
+        m = Map("#.\n..#\n#..")
+        self.assertEqual((m.r, m.c), (3, 3))
+        self.assertEqual(m.points(), [(0, 0), (2, 1), (0, 2)])
+
+        input_map = get_file_contents()
+        m = Map(input_map)
+        points = m.points()
+        for origin_point in points[::13]:
+            self.assertEqual(m.count_visible(origin_point), count_visible(origin_point, points))
+
+    def test_parallel(self):
+        input_map = get_file_contents()
+        self.assertEqual(solve_parallel(input_map, processes=2), solve_exact(input_map))
+        self.assertEqual(solve_parallel(input_map, processes=3, shard_size=7), solve_exact(input_map))
+        self.assertEqual(solve_parallel(".#.\n...", processes=2), (0, None))
 
     def test_samples(self):
+        self.check_max_sighted(".#.\n...", 0)
         self.check_max_sighted("""
 .#..#
 .....
@@ -279,6 +528,41 @@ class Tests(unittest.TestCase):
 ###.##.####.##.#..##""", starting_point=(11, 13), interested_asteroid=200)
         print(">>>> coords: ", interested_asteroid_coords)
 
+    def test_find_vaporized(self):
+        map_str = """
+.#..##.###...#######
+##.############..##.
+.#.######.########.#
+.###.#######.####.#.
+#####.##.#.##.###.##
+..#####..#.#########
+####################
+#.####....###.#.#.##
+##.#################
+#####.##.###..####..
+..######..##.#######
+####.##.####...##..#
+.#####..#.######.###
+##...#.##########...
+#.##########.#######
+.####.#.###.###.#.##
+....##.##.###..#####
+.#.#.###########.###
+#.#.#.#####.####.###
+###.##.####.##.#..##"""
+        ns = [1, 2, 3, 10, 20, 50, 100, 199, 200, 201, 299, 300]
+        self.assertEqual(find_vaporized(map_str, ns),
+                         [(11, 12), (12, 1), (12, 2), (12, 8), (16, 0), (16, 9), (10, 16), (9, 6), (8, 2),
+                          (10, 9), (11, 1), None])
+
+        self.assertEqual(find_vaporized("""
+.#....#####...#..
+##...##.#####..##
+##...#...#.#####.
+..#.....X...###..
+..#.#.....#....##""", range(1, 10), starting_point=(8, 3)),
+                         [(8, 1), (9, 0), (9, 1), (10, 0), (9, 2), (11, 1), (12, 1), (11, 2), (15, 1)])
+
 
 if __name__ == '__main__':
     # part1()
@@ -337,34 +337,95 @@ def output_to_rotation(o: int) -> int:
         raise Exception("Invalid direction.")
 
 
+class PanelGrid(object):
+    # One byte per panel in a row-major bytearray: bit 0 holds the colour,
+    # bit 1 is set once the panel was painted. The grid doubles its width or
+    # height towards any side a panel outside of it is painted on.
+    color_bit = 1
+    painted_bit = 2
+
+    def __init__(self, size: int = 16):
+        self.min_x = -(size // 2)
+        self.min_y = -(size // 2)
+        self.width = size
+        self.height = size
+        self.cells = bytearray(size * size)
+        self.painted_count = 0
+
+    def contains(self, x: int, y: int) -> bool:
+        return self.min_x <= x < self.min_x + self.width and self.min_y <= y < self.min_y + self.height
+
+    def grow(self, x: int, y: int):
+        min_x, min_y, width, height = self.min_x, self.min_y, self.width, self.height
+        while x < min_x:
+            min_x -= width
+            width *= 2
+        while x >= min_x + width:
+            width *= 2
+        while y < min_y:
+            min_y -= height
+            height *= 2
+        while y >= min_y + height:
+            height *= 2
+
+        cells = bytearray(width * height)
+        x_offset = self.min_x - min_x
+        for row in range(self.height):
+            start = (row + self.min_y - min_y) * width + x_offset
+            cells[start:start + self.width] = self.cells[row * self.width:(row + 1) * self.width]
+        self.min_x, self.min_y, self.width, self.height, self.cells = min_x, min_y, width, height, cells
+
+    def get_color(self, x: int, y: int) -> int:
+        if not self.contains(x, y):
+            return 0
+        return self.cells[(y - self.min_y) * self.width + x - self.min_x] & self.color_bit
+
+    def set_color(self, x: int, y: int, color: int):
+        if not self.contains(x, y):
+            self.grow(x, y)
+        i = (y - self.min_y) * self.width + x - self.min_x
+        self.cells[i] = (self.cells[i] & ~self.color_bit) | color
+
+    def paint(self, x: int, y: int, color: int):
+        if not self.contains(x, y):
+            self.grow(x, y)
+        i = (y - self.min_y) * self.width + x - self.min_x
+        if not self.cells[i] & self.painted_bit:
+            self.painted_count += 1
+        self.cells[i] = self.painted_bit | color
+
+    def white_panels(self) -> typing.List[typing.Tuple[int, int]]:
+        return [(i % self.width + self.min_x, i // self.width + self.min_y)
+                for i, cell in enumerate(self.cells) if cell & self.color_bit]
+
+
 def count_paints(starting_color: int) -> typing.Tuple[int, typing.List[typing.Tuple]]:
-    d = collections.defaultdict(lambda: 0)
-    d[(0, 0)] = starting_color
-    robot_location = (0, 0)
+    grid = PanelGrid()
+    grid.set_color(0, 0, starting_color)
+    x, y = 0, 0
 
     current_direction = Direction.U
-    visited_panels = set()
     input_program = get_file_contents()
     vm = create_program_str(input_program)
 
+    # The same two lists carry every step's camera input and robot output.
+    input_values = []
+    output_values = []
     while True:
-        input_values = [d[robot_location]]
-        output_values = []
+        input_values.append(grid.get_color(x, y))
+        output_values.clear()
         resume_program(vm, input_values, output_values)
 
         if vm.state == ProgramStateType.Halted:
             break
 
-        visited_panels.add(robot_location)
-
-        new_color = output_values[0]
-        d[robot_location] = new_color
+        new_color, rotation = output_values
+        grid.paint(x, y, new_color)
 
-        new_direction = (current_direction + output_to_rotation(output_values[1])) % 4
-        current_direction = new_direction
-        robot_location = move(robot_location, direction_dict[current_direction])
+        current_direction = (current_direction + output_to_rotation(rotation)) % 4
+        x, y = move((x, y), direction_dict[current_direction])
 
-    return len(visited_panels), list([coords for coords, color in d.items() if color == 1])
+    return grid.painted_count, grid.white_panels()
 
 
 def part1():
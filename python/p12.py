@@ -5,6 +5,8 @@ import unittest
 import math
 import copy
 import functools
+import array
+import concurrent.futures
 
 
 def get_file_contents() -> str:
@@ -111,6 +113,44 @@ def lcm(a, b):
     return abs(a*b) // math.gcd(a, b)
 
 
+def find_axis_period(axis_positions: typing.Sequence[int]) -> int:
+    # The axes never influence each other, so one axis is simulated on its
+    # own until positions and velocities are back at their initial state.
+    positions = array.array("q", axis_positions)
+    initial_positions = array.array("q", axis_positions)
+    velocities = array.array("q", [0] * len(positions))
+    stopped = array.array("q", velocities)
+    moon_pairs = list(itertools.combinations(range(len(positions)), 2))
+    moons = range(len(positions))
+
+    t = 0
+    while True:
+        for i, j in moon_pairs:
+            if positions[i] < positions[j]:
+                velocities[i] += 1
+                velocities[j] -= 1
+            elif positions[i] > positions[j]:
+                velocities[i] -= 1
+                velocities[j] += 1
+        for i in moons:
+            positions[i] += velocities[i]
+        t += 1
+        if velocities == stopped and positions == initial_positions:
+            return t
+
+
+def find_cycle_step_count(contents: str, processes: typing.Optional[int] = None) -> int:
+    positions = str_to_moon_pos(contents)
+    axes = [[p[axis] for p in positions] for axis in range(3)]
+    if processes == 1:
+        periods = [find_axis_period(axis) for axis in axes]
+    else:
+        # One task per axis, more workers than that would only sit idle.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(3, processes or os.cpu_count() or 1)) as executor:
+            periods = list(executor.map(find_axis_period, axes))
+    return functools.reduce(lcm, periods, 1)
+
+
 def part1():
     contents = get_file_contents()
     energy = solve(contents, steps=1000)
@@ -120,7 +160,7 @@ def part1():
 
 def part2():
     contents = get_file_contents()
-    cycle_step_count = solve(contents, return_cycle_step_count=True)
+    cycle_step_count = find_cycle_step_count(contents)
     print(cycle_step_count)
     assert cycle_step_count == 548525804273976
 
@@ -163,6 +203,16 @@ class Tests(unittest.TestCase):
 
         step_count = solve(contents, return_cycle_step_count=True)
         self.assertEqual(step_count, 4686774924)
+        self.assertEqual(find_cycle_step_count(contents, processes=1), 4686774924)
+        self.assertEqual(find_cycle_step_count(contents, processes=2), 4686774924)
+
+        contents = """
+<x=-1, y=0, z=2>
+<x=2, y=-10, z=-7>
+<x=4, y=-8, z=8>
+<x=3, y=5, z=-1>"""
+        self.assertEqual(find_axis_period([-1, 2, 4, 3]), 18)
+        self.assertEqual(find_cycle_step_count(contents, processes=1), 2772)
 
 
 if __name__ == '__main__':
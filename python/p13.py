@@ -74,38 +74,44 @@ def solve(passed_std_scr):
     max_x = 0
     max_y = 0
 
-    while True:
-        i = 0
-        paddle_action = [0]
-        if paddle_pos and ball_pos:
-            paddle_x, _ = paddle_pos
-            ball_x, _ = ball_pos
-            if ball_x < paddle_x:
-                paddle_action = [-1]
-            elif ball_x > paddle_x:
-                paddle_action = [1]
-
-        output_values = vm.resume(paddle_action)
-        output_len = len(output_values)
-        for j in range(0, output_len // 3):
-            x, y, tile = output_values[j * 3:j * 3 + 3]
-            if x == -1 and y == 0:
-                current_score = tile
-            else:
-                m[(x, y)] = Tile(tile)
-                if tile == Tile.Paddle:
-                    paddle_pos = x, y
-                elif tile == Tile.Ball:
-                    ball_pos = x, y
-
-        if vm.halted():
-            break
-
-        if use_curses:
-            if i == 0:
-                max_x, max_y = compute_bounds(m)
-            print_map(m, max_x, max_y, passed_std_scr)
-        i += 1
+    i = 0
+    game = vm.coroutine()
+    tile_values = []
+    for value in game:
+        while value is None:
+            if use_curses:
+                if i == 0:
+                    max_x, max_y = compute_bounds(m)
+                print_map(m, max_x, max_y, passed_std_scr)
+            i += 1
+
+            paddle_action = 0
+            if paddle_pos and ball_pos:
+                paddle_x, _ = paddle_pos
+                ball_x, _ = ball_pos
+                if ball_x < paddle_x:
+                    paddle_action = -1
+                elif ball_x > paddle_x:
+                    paddle_action = 1
+            try:
+                value = game.send(paddle_action)
+            except StopIteration:
+                return current_score
+
+        tile_values.append(value)
+        if len(tile_values) < 3:
+            continue
+        x, y, tile = tile_values
+        tile_values.clear()
+        if x == -1 and y == 0:
+            current_score = tile
+        else:
+            m[(x, y)] = Tile(tile)
+            if tile == Tile.Paddle:
+                paddle_pos = x, y
+            elif tile == Tile.Ball:
+                ball_pos = x, y
+
     return current_score
 
 
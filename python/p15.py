@@ -66,6 +66,8 @@ def print_map(m, max_x: int, max_y: int, robot_pos):
 def explore_map():
     m = collections.defaultdict(lambda: Tile.Undiscovered.value)
     vm = VM(get_file_contents())
+    robot = vm.coroutine()
+    next(robot)
 
     max_x, max_y = 50, 46
 
@@ -74,7 +76,7 @@ def explore_map():
 
     def move_robot(direction):
         nonlocal robot_pos
-        move_result, = vm.resume([move_command[direction]])
+        move_result = robot.send(move_command[direction])
         if move_result == MoveResult.Wall:
             m[translate(robot_pos, direction)] = Tile.Wall
             return False
@@ -2,6 +2,10 @@ import unittest
 import os
 import functools
 import operator
+import typing
+import itertools
+import multiprocessing
+import concurrent.futures
 
 
 def get_file_contents():
@@ -71,6 +75,15 @@ class Tests(unittest.TestCase):
             [1,1,1,4,99,5,6,0,99]),
             [30,1,1,4,2,5,6,0,99])
 
+    def test_find_patch_for_output(self):
+        program = [1, 0, 0, 0, 99, 7, 11]
+        # memory[0] = memory[noun] + memory[verb]
+        self.assertEqual(find_patch_for_output(program, 18, values=range(0, 7), processes=1), (5, 6))
+        self.assertIn(find_patch_for_output(program, 18, values=range(0, 7), processes=2), [(5, 6), (6, 5)])
+        self.assertEqual(find_patch_for_output(program, 1000, values=range(0, 7), processes=2), None)
+        self.assertEqual(find_patch_for_output(program, 12, patch_addresses=(2,), values=range(0, 7),
+                                               processes=1), (6,))
+
 
 def restore_gravity_assist_program():
     memory = get_numbers(get_file_contents())
@@ -84,19 +97,80 @@ def get_the_answer_to_life_the_universe_and_everything(noun, verb):
     print(100 * int(noun) + int(verb))
 
 
+_worker_program: typing.List[int] = []
+_worker_memory: typing.List[int] = []
+_worker_found = None
+
+
+def _init_search_worker(program: typing.List[int], found_event):
+    global _worker_program, _worker_memory, _worker_found
+    _worker_program = program
+    # One buffer per worker, restored in place before every run.
+    _worker_memory = list(program)
+    _worker_found = found_event
+
+
+def _search_shard(first_values: typing.Sequence[int],
+                  other_values: typing.Sequence[typing.Sequence[int]],
+                  patch_addresses: typing.Sequence[int],
+                  output_address: int,
+                  target: int) -> typing.Optional[typing.Tuple[int, ...]]:
+    memory = _worker_memory
+    for first_value in first_values:
+        # Checked once per row, so the shared event costs nothing per run.
+        if _worker_found is not None and _worker_found.is_set():
+            return None
+        for rest in itertools.product(*other_values):
+            values = (first_value,) + rest
+            memory[:] = _worker_program
+            for address, value in zip(patch_addresses, values):
+                memory[address] = value
+            run_program(memory)
+            if memory[output_address] == target:
+                if _worker_found is not None:
+                    _worker_found.set()
+                return values
+    return None
+
+
+def find_patch_for_output(program: typing.List[int],
+                          target: int,
+                          patch_addresses: typing.Sequence[int] = (1, 2),
+                          values: typing.Sequence[int] = range(0, 100),
+                          output_address: int = 0,
+                          processes: typing.Optional[int] = None) -> typing.Optional[typing.Tuple[int, ...]]:
+    values = list(values)
+    other_values = [values] * (len(patch_addresses) - 1)
+    search_args = (other_values, patch_addresses, output_address, target)
+
+    if processes == 1:
+        _init_search_worker(program, None)
+        return _search_shard(values, *search_args)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    shards = [values[i::processes] for i in range(processes)]
+    found_event = multiprocessing.Event()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                initializer=_init_search_worker,
+                                                initargs=(program, found_event)) as executor:
+        futures = [executor.submit(_search_shard, shard, *search_args) for shard in shards if shard]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if result is not None:
+                found_event.set()
+                for other in futures:
+                    other.cancel()
+                return result
+    return None
+
+
 def restore_gravity_assist_program_real():
     memory = get_numbers(get_file_contents())
-    memory_backup = list(memory)
-
-    for noun in range(0, 100):
-        for verb in range(0, 100):
-            memory[1] = noun
-            memory[2] = verb
-            run_program(memory)
-            if memory[0] == 19690720:
-                get_the_answer_to_life_the_universe_and_everything(noun, verb)
-                return
-            memory = list(memory_backup)
+    result = find_patch_for_output(memory, 19690720)
+    if result is not None:
+        noun, verb = result
+        get_the_answer_to_life_the_universe_and_everything(noun, verb)
 
 
 if __name__ == '__main__':
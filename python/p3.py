@@ -1,5 +1,14 @@
 import unittest
 import os
+import bisect
+import collections
+import typing
+import heapq
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def get_file_contents():
@@ -60,20 +69,227 @@ def find_closest_intersection(wire1, wire2, count_steps=False):
     return min_distance
 
 
-def find_closest_intersection_str(wire1_str, wire2_str, count_steps=False):
+def find_closest_intersection_str(wire1_str, wire2_str, count_steps=False, engine="points"):
     wire1 = split_entries(wire1_str)
     wire2 = split_entries(wire2_str)
+    if engine == "segments":
+        return find_closest_intersection_segments(wire1, wire2, count_steps)
+    elif engine == "numpy":
+        return find_closest_intersection_numpy(wire1, wire2, count_steps)
     return find_closest_intersection(wire1, wire2, count_steps)
 
 
+# Coordinates are packed into one int64 key, 32 bits per axis: x in the
+# signed high half and y, shifted to be non-negative, in the low half.
+coordinate_offset = 1 << 31
+
+
+def compute_points_numpy(wire):
+    # Returns the sorted packed keys of all visited points and the step
+    # count of the first visit to each of them.
+    letters = "LRUD"
+    deltas = np.array([delta(letter) for letter in letters], dtype=np.int64)
+    directions = np.array([letters.index(direction) for direction, _ in wire], dtype=np.int64)
+    lengths = np.array([steps_to_take for _, steps_to_take in wire], dtype=np.int64)
+
+    step_deltas = np.repeat(deltas[directions], lengths, axis=0)
+    xs = np.cumsum(step_deltas[:, 0])
+    ys = np.cumsum(step_deltas[:, 1])
+    keys = (xs << 32) | (ys + coordinate_offset)
+
+    # np.unique reports the index of the first occurrence of every key.
+    unique_keys, first_visit = np.unique(keys, return_index=True)
+    return unique_keys, first_visit + 1
+
+
+def find_closest_intersection_numpy(wire1, wire2, count_steps=False):
+    wire1_keys, wire1_steps = compute_points_numpy(wire1)
+    wire2_keys, wire2_steps = compute_points_numpy(wire2)
+    common_keys, wire1_indices, wire2_indices = np.intersect1d(wire1_keys, wire2_keys,
+                                                               assume_unique=True, return_indices=True)
+
+    if count_steps:
+        return int(np.min(wire1_steps[wire1_indices] + wire2_steps[wire2_indices]))
+    xs = common_keys >> 32
+    ys = (common_keys & 0xFFFFFFFF) - coordinate_offset
+    return int(np.min(np.abs(xs) + np.abs(ys)))
+
+
+# A segment is (fixed, lo, hi, start, steps): the points (x, fixed) for
+# horizontal or (fixed, y) for vertical segments with lo <= x/y <= hi. The
+# start coordinate itself is not part of the segment, it belongs to the
+# previous one. The point at coordinate c is reached after
+# steps + abs(c - start) steps.
+Segment = typing.Tuple[int, int, int, int, int]
+
+
+def compute_segments(wire) -> typing.Tuple[typing.List[Segment], typing.List[Segment]]:
+    horizontal = []
+    vertical = []
+    x, y = 0, 0
+    steps = 0
+    for direction, steps_to_take in wire:
+        x_delta, y_delta = delta(direction)
+        if steps_to_take > 0:
+            if x_delta:
+                end = x + x_delta * steps_to_take
+                horizontal.append((y, min(x + x_delta, end), max(x + x_delta, end), x, steps))
+                x = end
+            else:
+                end = y + y_delta * steps_to_take
+                vertical.append((x, min(y + y_delta, end), max(y + y_delta, end), y, steps))
+                y = end
+        steps += steps_to_take
+    return horizontal, vertical
+
+
+def perpendicular_crossings(horizontal: typing.List[Segment],
+                            vertical: typing.List[Segment]
+                            ) -> typing.Iterator[typing.Tuple[int, int, int, int, int]]:
+    # Sweeps over x, keeping the horizontal segments under the sweep line
+    # sorted by y, and queries them with every vertical segment. Yields
+    # (x, y, steps, horizontal index, vertical index).
+    add_event, query_event, remove_event = 0, 1, 2
+    events = []
+    for i, (y, lo, hi, _, _) in enumerate(horizontal):
+        events.append((lo, add_event, i))
+        events.append((hi, remove_event, i))
+    for i, (x, _, _, _, _) in enumerate(vertical):
+        events.append((x, query_event, i))
+    events.sort()
+
+    active = []
+    for x, event, i in events:
+        if event == add_event:
+            bisect.insort(active, (horizontal[i][0], i))
+        elif event == remove_event:
+            del active[bisect.bisect_left(active, (horizontal[i][0], i))]
+        else:
+            _, v_lo, v_hi, v_start, v_steps = vertical[i]
+            first = bisect.bisect_left(active, (v_lo, -1))
+            last = bisect.bisect_right(active, (v_hi, len(horizontal)))
+            for y, j in active[first:last]:
+                _, _, _, h_start, h_steps = horizontal[j]
+                yield x, y, h_steps + abs(x - h_start) + v_steps + abs(y - v_start), j, i
+
+
+def collinear_crossings(segments1: typing.List[Segment],
+                        segments2: typing.List[Segment]
+                        ) -> typing.Iterator[typing.Tuple[int, int, int]]:
+    # Overlapping parallel segments share a whole range of points. Both the
+    # distance to the origin and the step count are linear within the
+    # overlap, apart from the distance kink at 0, so only the overlap ends
+    # and 0 are yielded, as (coordinate along the line, fixed, steps).
+    lines = collections.defaultdict(list)
+    for s in segments2:
+        lines[s[0]].append(s)
+
+    for fixed, lo1, hi1, start1, steps1 in segments1:
+        for _, lo2, hi2, start2, steps2 in lines.get(fixed, ()):
+            lo, hi = max(lo1, lo2), min(hi1, hi2)
+            if lo > hi:
+                continue
+            candidates = {lo, hi}
+            if lo < 0 < hi:
+                candidates.add(0)
+            for c in candidates:
+                yield c, fixed, steps1 + abs(c - start1) + steps2 + abs(c - start2)
+
+
+def segment_intersections(wire1, wire2) -> typing.Iterator[typing.Tuple[int, int, int]]:
+    horizontal1, vertical1 = compute_segments(wire1)
+    horizontal2, vertical2 = compute_segments(wire2)
+    yield from ((x, y, steps) for x, y, steps, _, _ in perpendicular_crossings(horizontal1, vertical2))
+    yield from ((x, y, steps) for x, y, steps, _, _ in perpendicular_crossings(horizontal2, vertical1))
+    yield from collinear_crossings(horizontal1, horizontal2)
+    yield from ((x, y, steps) for y, x, steps in collinear_crossings(vertical1, vertical2))
+
+
+def find_closest_intersection_segments(wire1, wire2, count_steps=False):
+    if count_steps:
+        return min(steps for _, _, steps in segment_intersections(wire1, wire2))
+    return min(distance((0, 0), (x, y)) for x, y, _ in segment_intersections(wire1, wire2))
+
+
+Crossing = collections.namedtuple("Crossing", ["wire1", "wire2", "x", "y", "steps"])
+
+
+def collinear_overlaps(segments: typing.List[Segment],
+                       wire_ids: typing.List[int]
+                       ) -> typing.Iterator[typing.Tuple[int, int, int, int, int]]:
+    # Yields every shared point of overlapping parallel segments from
+    # different wires, as (coordinate along the line, fixed, steps, wire,
+    # other wire). Segments on a line are swept in order of their start,
+    # keeping only those which still reach the sweep position.
+    lines = collections.defaultdict(list)
+    for i, s in enumerate(segments):
+        lines[s[0]].append(i)
+
+    for fixed, indices in lines.items():
+        indices.sort(key=lambda k: segments[k][1])
+        active = []
+        for i in indices:
+            _, lo1, hi1, start1, steps1 = segments[i]
+            active = [j for j in active if segments[j][2] >= lo1]
+            for j in active:
+                if wire_ids[i] == wire_ids[j]:
+                    continue
+                _, _, hi2, start2, steps2 = segments[j]
+                for c in range(lo1, min(hi1, hi2) + 1):
+                    yield c, fixed, steps1 + abs(c - start1) + steps2 + abs(c - start2), wire_ids[j], wire_ids[i]
+            active.append(i)
+
+
+def find_wire_crossings(wires, k=None, count_steps=False) -> typing.List[Crossing]:
+    # All crossings between pairs of different wires, sorted by the distance
+    # to the origin (or the combined step count). A point two wires share
+    # several times is reported once, with its first-visit step counts.
+    # With k, only the k closest crossings are returned.
+    horizontal, horizontal_ids = [], []
+    vertical, vertical_ids = [], []
+    for wire_id, wire in enumerate(wires):
+        wire_horizontal, wire_vertical = compute_segments(wire)
+        horizontal.extend(wire_horizontal)
+        horizontal_ids.extend([wire_id] * len(wire_horizontal))
+        vertical.extend(wire_vertical)
+        vertical_ids.extend([wire_id] * len(wire_vertical))
+
+    def crossings():
+        for x, y, steps, h, v in perpendicular_crossings(horizontal, vertical):
+            if horizontal_ids[h] != vertical_ids[v]:
+                yield x, y, steps, horizontal_ids[h], vertical_ids[v]
+        yield from collinear_overlaps(horizontal, horizontal_ids)
+        for y, x, steps, wire1, wire2 in collinear_overlaps(vertical, vertical_ids):
+            yield x, y, steps, wire1, wire2
+
+    min_steps = {}
+    for x, y, steps, wire1, wire2 in crossings():
+        key = (min(wire1, wire2), max(wire1, wire2), x, y)
+        if key not in min_steps or steps < min_steps[key]:
+            min_steps[key] = steps
+
+    found = (Crossing(wire1, wire2, x, y, steps) for (wire1, wire2, x, y), steps in min_steps.items())
+    if count_steps:
+        sort_key = lambda c: (c.steps, c.wire1, c.wire2, c.x, c.y)
+    else:
+        sort_key = lambda c: (distance((0, 0), (c.x, c.y)), c.wire1, c.wire2, c.x, c.y)
+    if k is not None:
+        return heapq.nsmallest(k, found, key=sort_key)
+    return sorted(found, key=sort_key)
+
+
+def find_wire_crossings_str(wire_strs, k=None, count_steps=False) -> typing.List[Crossing]:
+    return find_wire_crossings([split_entries(s) for s in wire_strs], k, count_steps)
+
+
 def part1():
     contents = get_file_contents()
-    print(find_closest_intersection_str(contents[0], contents[1]))
+    print(find_closest_intersection_str(contents[0], contents[1], engine="segments"))
 
 
 def part2():
     contents = get_file_contents()
-    print(find_closest_intersection_str(contents[0], contents[1], count_steps=True))
+    print(find_closest_intersection_str(contents[0], contents[1], count_steps=True, engine="segments"))
 
 
 class Tests(unittest.TestCase):
@@ -98,6 +314,47 @@ class Tests(unittest.TestCase):
             "U98,R91,D20,R16,D67,R40,U7,R15,U6,R7", count_steps=True),
             410)
 
+    def test_engines(self):
+        contents = get_file_contents()
+        wire_pairs = [
+            ("R75,D30,R83,U83,L12,D49,R71,U7,L72", "U62,R66,U55,R34,D71,R55,D58,R83"),
+            ("R98,U47,R26,D63,R33,U87,L62,D20,R33,U53,R51", "U98,R91,D20,R16,D67,R40,U7,R15,U6,R7"),
+            # Overlapping parallel runs, a revisited point and a wire
+            # crossing the origin.
+            ("R8,U5,L5,D3", "U7,R6,D4,L4"),
+            ("R10,L4,U3", "U2,R3,D2,R10"),
+            ("L5,R10,U1", "D1,R2,U2,L4,D1,L3"),
+            ("U3,D6,R2,U1,L5", "R1,U2,L2,D4,R4,U0,L1"),
+            (contents[0], contents[1]),
+        ]
+        for wire1, wire2 in wire_pairs:
+            for count_steps in (False, True):
+                self.assertEqual(find_closest_intersection_str(wire1, wire2, count_steps, engine="segments"),
+                                 find_closest_intersection_str(wire1, wire2, count_steps))
+                if np is not None:
+                    self.assertEqual(find_closest_intersection_str(wire1, wire2, count_steps, engine="numpy"),
+                                     find_closest_intersection_str(wire1, wire2, count_steps))
+
+    def test_wire_crossings(self):
+        wires = ["R8,U5,L5,D3", "U7,R6,D4,L4", "R10,L4,U3"]
+        crossings = find_wire_crossings_str(wires)
+        # Wires 0 and 2 share the run from (1, 0) to (8, 0).
+        self.assertEqual(crossings[:2], [Crossing(0, 2, 1, 0, 2), Crossing(0, 2, 2, 0, 4)])
+        self.assertEqual(crossings[:3], find_wire_crossings_str(wires, k=3))
+        self.assertEqual(find_wire_crossings_str(wires, k=1, count_steps=True), [Crossing(0, 2, 1, 0, 2)])
+
+        # Pairwise crossings match the two-wire engine.
+        for i, j in [(0, 1), (0, 2), (1, 2)]:
+            pair = [c for c in crossings if (c.wire1, c.wire2) == (i, j)]
+            for count_steps in (False, True):
+                closest = find_wire_crossings_str([wires[i], wires[j]], k=1, count_steps=count_steps)[0]
+                expected = find_closest_intersection_str(wires[i], wires[j], count_steps)
+                if count_steps:
+                    self.assertEqual(closest.steps, expected)
+                    self.assertEqual(min(c.steps for c in pair), expected)
+                else:
+                    self.assertEqual(distance((0, 0), (closest.x, closest.y)), expected)
+
 
 if __name__ == '__main__':
     part1()
@@ -1,5 +1,7 @@
 import unittest
 import typing
+import itertools
+import functools
 
 
 def is_valid_password(p: str, p_range: typing.Tuple[int, int],
@@ -52,6 +54,101 @@ def count_valid_passwords(p_range: typing.Tuple[int, int], strict_doubles: bool
     return valid_passwords_count
 
 
+def non_decreasing_numbers(length: int, p_range: typing.Tuple[int, int]) -> typing.Iterator[typing.Tuple[int, ...]]:
+    # Yields the digits of every number with exactly `length` digits, none
+    # lower than the one before it, with p_range[0] <= number < p_range[1].
+    # A prefix is dropped as soon as even its largest completion (all 9s) is
+    # below the range, or its smallest one (repeating the last digit) is
+    # not below the range end.
+    low, high = p_range
+    digits = []
+
+    def extend(prefix_value: int, first_digit: int):
+        remaining = length - len(digits)
+        if remaining == 0:
+            yield tuple(digits)
+            return
+        scale = 10 ** (remaining - 1)
+        repunit = (scale - 1) // 9
+        for d in range(first_digit, 10):
+            value = prefix_value * 10 + d
+            smallest = value * scale + d * repunit
+            largest = value * scale + 9 * repunit
+            if smallest >= high:
+                break
+            if largest < low:
+                continue
+            digits.append(d)
+            yield from extend(value, d)
+            digits.pop()
+
+    # A leading zero would make the number shorter than `length`.
+    yield from extend(0, 1)
+
+
+def has_double_digits(digits: typing.Sequence[int], strict_doubles: bool = False) -> bool:
+    run_lengths = [len(list(run)) for _, run in itertools.groupby(digits)]
+    if strict_doubles:
+        return 2 in run_lengths
+    return any(run_length > 1 for run_length in run_lengths)
+
+
+def count_valid_passwords_enumerated(p_range: typing.Tuple[int, int],
+                                     strict_doubles: bool = False,
+                                     length: int = 6) -> int:
+    return sum(1 for digits in non_decreasing_numbers(length, p_range)
+               if has_double_digits(digits, strict_doubles))
+
+
+def count_valid_passwords_up_to(upper: int, length: int, strict_doubles: bool = False) -> int:
+    # Counts valid passwords with exactly `length` digits that are <= upper,
+    # with a digit DP over (position, last digit, current run length,
+    # has exact double, has any double, tight to upper). Run lengths above 3
+    # behave like 3.
+    if upper < 10 ** (length - 1):
+        return 0
+    upper = min(upper, 10 ** length - 1)
+    upper_digits = [int(d) for d in str(upper)]
+
+    @functools.lru_cache(maxsize=None)
+    def count(position: int, last_digit: int, run_length: int,
+              has_exact_double: bool, has_any_double: bool, tight: bool) -> int:
+        if position == length:
+            if strict_doubles:
+                return int(has_exact_double or run_length == 2)
+            return int(has_any_double or run_length >= 2)
+
+        total = 0
+        max_digit = upper_digits[position] if tight else 9
+        for d in range(max(last_digit, 1), max_digit + 1):
+            if d == last_digit:
+                total += count(position + 1, d, min(run_length + 1, 3),
+                               has_exact_double, has_any_double, tight and d == max_digit)
+            else:
+                total += count(position + 1, d, 1,
+                               has_exact_double or run_length == 2, has_any_double or run_length >= 2,
+                               tight and d == max_digit)
+        return total
+
+    return count(0, 0, 0, False, False, True)
+
+
+def count_valid_passwords_dp(p_range: typing.Tuple[int, int],
+                             strict_doubles: bool = False,
+                             length: typing.Optional[int] = 6) -> int:
+    # Same range semantics as count_valid_passwords: p_range[0] <= p <
+    # p_range[1]. With length=None, passwords of any length in the range
+    # are counted.
+    low, high = p_range
+    if length is None:
+        lengths = range(1, len(str(max(high - 1, 1))) + 1)
+    else:
+        lengths = [length]
+    return sum(count_valid_passwords_up_to(high - 1, l, strict_doubles) -
+               count_valid_passwords_up_to(low - 1, l, strict_doubles)
+               for l in lengths)
+
+
 class Tests(unittest.TestCase):
     def test_samples(self):
         self.assertEqual(is_valid_password("111111", (100000, 200000)), True)
@@ -67,15 +164,46 @@ class Tests(unittest.TestCase):
         self.assertEqual(is_valid_password("123444", (100000, 200000), strict_doubles=True), False)
         self.assertEqual(is_valid_password("111122", (100000, 200000), strict_doubles=True), True)
 
+    def test_enumerated(self):
+        self.assertEqual(list(non_decreasing_numbers(2, (10, 100)))[:3], [(1, 1), (1, 2), (1, 3)])
+        self.assertEqual(len(list(non_decreasing_numbers(2, (10, 100)))), 45)
+        self.assertEqual(list(non_decreasing_numbers(3, (123, 130))), [(1, 2, 3), (1, 2, 4), (1, 2, 5), (1, 2, 6),
+                                                                       (1, 2, 7), (1, 2, 8), (1, 2, 9)])
+
+        for p_range in [(100000, 200000), (111111, 111112), (122345, 133333), (234567, 345678), (0, 150000)]:
+            for strict_doubles in (False, True):
+                self.assertEqual(count_valid_passwords_enumerated(p_range, strict_doubles),
+                                 count_valid_passwords(p_range, strict_doubles))
+
+        self.assertEqual(count_valid_passwords_enumerated((124075, 580769)), 2150)
+        self.assertEqual(count_valid_passwords_enumerated((124075, 580769), strict_doubles=True), 1462)
+
+    def test_dp(self):
+        for p_range in [(100000, 200000), (111111, 111112), (122345, 133333), (234567, 345678), (0, 150000)]:
+            for strict_doubles in (False, True):
+                self.assertEqual(count_valid_passwords_dp(p_range, strict_doubles),
+                                 count_valid_passwords(p_range, strict_doubles))
+
+        for p_range, length in [((10 ** 9, 10 ** 10), 10), ((1234567890, 6789012345), 10), ((0, 10 ** 3), 3)]:
+            for strict_doubles in (False, True):
+                self.assertEqual(count_valid_passwords_dp(p_range, strict_doubles, length),
+                                 count_valid_passwords_enumerated(p_range, strict_doubles, length))
+
+        # Any length: 11, 22, ..., 99 and the three-digit ones.
+        self.assertEqual(count_valid_passwords_dp((0, 1000), length=None),
+                         9 + count_valid_passwords_enumerated((100, 1000), length=3))
+        self.assertEqual(count_valid_passwords_dp((124075, 580769)), 2150)
+        self.assertEqual(count_valid_passwords_dp((124075, 580769), strict_doubles=True), 1462)
+
 
 def part1():
-    count = count_valid_passwords((124075, 580769))
+    count = count_valid_passwords_enumerated((124075, 580769))
     print(count)
     assert count == 2150
 
 
 def part2():
-    count = count_valid_passwords((124075, 580769), strict_doubles=True)
+    count = count_valid_passwords_enumerated((124075, 580769), strict_doubles=True)
     print(count)
     assert count == 1462
 
@@ -1,20 +1,44 @@
 import unittest
 import os
 import typing
-from collections import deque
+import array
+import tempfile
+import time
 
 
-def get_file_contents() -> str:
+def get_file_path() -> str:
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    file_path = os.path.join(dir_path, "..", "data", "d6.txt")
+    return os.path.join(dir_path, "..", "data", "d6.txt")
+
+
+def get_file_contents() -> str:
+    file_path = get_file_path()
     with open(file_path, "r") as f:
         lines = f.read()
         return lines
 
 
 class OrbitGraph(object):
+    # Body names are interned to ints. Every body stores its parent in a flat
+    # array, and the children lists are kept in CSR form (child_offsets[i] to
+    # child_offsets[i + 1] index into children), rebuilt when edges changed.
+    #
+    # The first count_number_of_orbits call computes the total orbit count and
+    # every subtree size. From then on, add_edge and remove_edge keep both up
+    # to date by walking the ancestors of the changed edge only.
     def __init__(self):
-        self.edges: typing.Dict[str, typing.List[str]] = {}
+        self.ids: typing.Dict[str, int] = {}
+        self.names: typing.List[str] = []
+        self.parents = array.array("i")
+        self.child_counts = array.array("i")
+        self.child_offsets = array.array("i")
+        self.children = array.array("i")
+        self._children_valid = False
+        # Bumped on every edge change, lets derived indexes detect that they
+        # are stale.
+        self.version = 0
+        self.subtree_sizes: typing.Optional[array.array] = None
+        self.orbit_count: typing.Optional[int] = None
 
     @staticmethod
     def create_graph_from_input_string(s: str):
@@ -25,61 +49,274 @@ class OrbitGraph(object):
                 g.add_edge(central_object, orbiter)
         return g
 
+    @staticmethod
+    def create_graph_from_file(file_path: str, chunk_size: int = 1 << 20):
+        # Reads the map in binary chunks, only keeping the current chunk and
+        # the line cut by its end besides the graph itself.
+        g = OrbitGraph()
+        with open(file_path, "rb") as f:
+            remainder = b""
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                block = remainder + block
+                end = block.rfind(b"\n") + 1
+                remainder = block[end:]
+                g.add_edges_from_bytes(block[:end])
+            g.add_edges_from_bytes(remainder)
+        return g
+
+    def add_edges_from_bytes(self, data: bytes):
+        # Splits on ')' and whitespace at once, so names come out in
+        # (central object, orbiter) pairs without a string per line.
+        names = data.replace(b")", b" ").split()
+        if len(names) != 2 * data.count(b")"):
+            raise ValueError("Malformed orbit map.")
+        names_iter = iter(names)
+        for central_object, orbiter in zip(names_iter, names_iter):
+            self.add_edge(central_object.decode(), orbiter.decode())
+
+    def intern(self, name: str) -> int:
+        object_id = self.ids.get(name)
+        if object_id is None:
+            object_id = len(self.names)
+            self.ids[name] = object_id
+            self.names.append(name)
+            self.parents.append(-1)
+            self.child_counts.append(0)
+            if self.subtree_sizes is not None:
+                self.subtree_sizes.append(1)
+        return object_id
+
+    def get_depth(self, object_id: int) -> int:
+        depth = 0
+        parent = self.parents[object_id]
+        while parent >= 0:
+            depth += 1
+            parent = self.parents[parent]
+        return depth
+
+    def _update_ancestors(self, object_id: int, size_delta: int) -> int:
+        # Adds size_delta to the subtree size of object_id and all of its
+        # ancestors, returns the depth of object_id.
+        depth = -1
+        while object_id >= 0:
+            self.subtree_sizes[object_id] += size_delta
+            object_id = self.parents[object_id]
+            depth += 1
+        return depth
+
+    def _detach(self, orbiter_id: int):
+        central_id = self.parents[orbiter_id]
+        if self.orbit_count is not None:
+            size = self.subtree_sizes[orbiter_id]
+            central_depth = self._update_ancestors(central_id, -size)
+            self.orbit_count -= size * (central_depth + 1)
+        self.child_counts[central_id] -= 1
+        self.parents[orbiter_id] = -1
+        self._children_valid = False
+        self.version += 1
+
     def add_edge(self, central_object: str, orbiter: str):
-        if central_object not in self.edges:
-            self.edges[central_object] = []
-        if orbiter not in self.edges:
-            self.edges[orbiter] = []
-        self.edges[central_object].append(orbiter)
-        self.edges[orbiter].append(central_object)
+        # An orbiter which already orbits something is moved with its whole
+        # subtree.
+        central_id = self.intern(central_object)
+        orbiter_id = self.intern(orbiter)
+        # Checked before anything changes, so a rejected edge leaves the
+        # graph as it was. Only an orbiter with children can end up orbiting
+        # itself, which keeps bulk loading free of ancestor walks.
+        ancestor = central_id if self.child_counts[orbiter_id] else -1
+        while ancestor >= 0:
+            if ancestor == orbiter_id:
+                raise ValueError("{} can't orbit {}, it would orbit itself.".format(orbiter, central_object))
+            ancestor = self.parents[ancestor]
+        if central_id == orbiter_id:
+            raise ValueError("{} can't orbit itself.".format(orbiter))
+
+        if self.parents[orbiter_id] >= 0:
+            self._detach(orbiter_id)
+        self.parents[orbiter_id] = central_id
+        self.child_counts[central_id] += 1
+        self._children_valid = False
+        self.version += 1
+        if self.orbit_count is not None:
+            size = self.subtree_sizes[orbiter_id]
+            central_depth = self._update_ancestors(central_id, size)
+            self.orbit_count += size * (central_depth + 1)
+
+    def remove_edge(self, central_object: str, orbiter: str):
+        orbiter_id = self.ids.get(orbiter)
+        if orbiter_id is None or self.parents[orbiter_id] != self.ids.get(central_object):
+            raise ValueError("{} does not orbit {}.".format(orbiter, central_object))
+        self._detach(orbiter_id)
+
+    def get_subtree_size(self, name: str) -> int:
+        self.count_number_of_orbits()
+        return self.subtree_sizes[self.ids[name]]
+
+    def __len__(self):
+        return len(self.names)
 
     def __str__(self):
         s = ""
-        for center, orbiters in self.edges.items():
-            s += "{} {}\n".format(center, orbiters)
+        for i, name in enumerate(self.names):
+            s += "{} {}\n".format(name, [self.names[c] for c in self.get_children(i)])
         return s
 
-    def bfs(self,
-            start_object: str,
-            end_object: str,
-            on_visit) -> typing.Any:
-        visited = set()
-        to_visit = deque([(start_object, 0)])
-        while to_visit:
-            current_object, steps = to_visit.popleft()
-            visited.add(current_object)
+    def build_children(self):
+        if self._children_valid:
+            return
+        object_count = len(self.names)
+        offsets = array.array("i", bytes(4 * (object_count + 1)))
+        for parent in self.parents:
+            if parent >= 0:
+                offsets[parent + 1] += 1
+        for i in range(object_count):
+            offsets[i + 1] += offsets[i]
 
-            if on_visit(current_object, steps, end_object):
-                return
+        children = array.array("i", bytes(4 * offsets[object_count]))
+        fill = offsets[:-1]
+        for orbiter, parent in enumerate(self.parents):
+            if parent >= 0:
+                children[fill[parent]] = orbiter
+                fill[parent] += 1
 
-            if current_object in self.edges:
-                for child in self.edges[current_object]:
-                    if child not in visited:
-                        to_visit.append((child, steps + 1))
+        self.child_offsets = offsets
+        self.children = children
+        self._children_valid = True
 
-    def count_number_of_orbits(self) -> int:
-        total_number_of_orbits = 0
+    def get_children(self, object_id: int) -> array.array:
+        self.build_children()
+        return self.children[self.child_offsets[object_id]:self.child_offsets[object_id + 1]]
 
-        def on_visit(_, current_steps: int, __) -> bool:
-            nonlocal total_number_of_orbits
-            total_number_of_orbits += current_steps
-            return False
+    def topological_order(self) -> array.array:
+        # Roots first, every body after its parent.
+        self.build_children()
+        offsets = self.child_offsets
+        children = self.children
+        order = array.array("i", (i for i, parent in enumerate(self.parents) if parent < 0))
+        i = 0
+        while i < len(order):
+            object_id = order[i]
+            order.extend(children[offsets[object_id]:offsets[object_id + 1]])
+            i += 1
+        return order
 
-        self.bfs("COM", "", on_visit)
+    def compute_depths(self) -> array.array:
+        depths = array.array("i", bytes(4 * len(self.names)))
+        parents = self.parents
+        for object_id in self.topological_order():
+            parent = parents[object_id]
+            if parent >= 0:
+                depths[object_id] = depths[parent] + 1
+        return depths
 
-        return total_number_of_orbits
+    def compute_subtree_sizes(self) -> array.array:
+        sizes = array.array("i", [1]) * len(self.names)
+        parents = self.parents
+        for object_id in reversed(self.topological_order()):
+            parent = parents[object_id]
+            if parent >= 0:
+                sizes[parent] += sizes[object_id]
+        return sizes
+
+    def count_number_of_orbits(self) -> int:
+        if self.orbit_count is None:
+            self.orbit_count = sum(self.compute_depths())
+            self.subtree_sizes = self.compute_subtree_sizes()
+        return self.orbit_count
+
+    def get_distance(self, a: int, b: int, depths: array.array) -> int:
+        # Climbs from the deeper body until both paths meet, -1 when the
+        # bodies are not connected.
+        parents = self.parents
+        distance = 0
+        while depths[a] > depths[b]:
+            a = parents[a]
+            distance += 1
+        while depths[b] > depths[a]:
+            b = parents[b]
+            distance += 1
+        while a != b:
+            a, b = parents[a], parents[b]
+            distance += 2
+            if a < 0 or b < 0:
+                return -1
+        return distance
 
     def get_minimum_transfers(self, start_object: str, end_object: str) -> int:
-        min_transfers = -1
+        # Transfers happen between the bodies the two objects orbit, which
+        # skips the first and the last step of the path between them.
+        if start_object not in self.ids or end_object not in self.ids:
+            return -1
+        distance = self.get_distance(self.ids[start_object], self.ids[end_object], self.compute_depths())
+        if distance < 0:
+            return -1
+        return distance - 2
+
+
+class AncestorIndex(object):
+    # Binary lifting: ancestors[k][i] is the 2^k-th ancestor of body i, roots
+    # are their own ancestors. Built once per graph, answers the distance
+    # between any two bodies in O(log n). Queries raise once the graph
+    # changed after the index was built.
+    def __init__(self, g: OrbitGraph):
+        self.graph = g
+        self.version = g.version
+        self.ids = dict(g.ids)
+        self.depths = g.compute_depths()
+        first = array.array("i", (parent if parent >= 0 else i for i, parent in enumerate(g.parents)))
+        self.ancestors = [first]
+        max_depth = max(self.depths, default=0)
+        while (1 << len(self.ancestors)) <= max_depth:
+            previous = self.ancestors[-1]
+            self.ancestors.append(array.array("i", (previous[a] for a in previous)))
 
-        def on_visit(current_object: str, current_steps: int, end_goal: str) -> bool:
-            nonlocal min_transfers
-            if current_object == end_goal:
-                min_transfers = current_steps - 2
-                return True
+    def lift(self, object_id: int, steps: int) -> int:
+        k = 0
+        while steps:
+            if steps & 1:
+                object_id = self.ancestors[k][object_id]
+            steps >>= 1
+            k += 1
+        return object_id
 
-        self.bfs(start_object, end_object, on_visit)
-        return min_transfers
+    def lowest_common_ancestor(self, a: int, b: int) -> int:
+        # -1 when the bodies are in different trees.
+        depths = self.depths
+        if depths[a] < depths[b]:
+            a, b = b, a
+        a = self.lift(a, depths[a] - depths[b])
+        if a == b:
+            return a
+        for level in reversed(self.ancestors):
+            if level[a] != level[b]:
+                a, b = level[a], level[b]
+        a, b = self.ancestors[0][a], self.ancestors[0][b]
+        if a != b:
+            return -1
+        return a
+
+    def get_distance(self, a: int, b: int) -> int:
+        ancestor = self.lowest_common_ancestor(a, b)
+        if ancestor < 0:
+            return -1
+        return self.depths[a] + self.depths[b] - 2 * self.depths[ancestor]
+
+    def get_minimum_transfers(self, start_object: str, end_object: str) -> int:
+        if self.graph.version != self.version:
+            raise ValueError("The orbit graph changed since the index was built.")
+        if start_object not in self.ids or end_object not in self.ids:
+            return -1
+        distance = self.get_distance(self.ids[start_object], self.ids[end_object])
+        if distance < 0:
+            return -1
+        return distance - 2
+
+    def get_minimum_transfers_batch(self,
+                                    queries: typing.Iterable[typing.Tuple[str, str]]) -> typing.List[int]:
+        return [self.get_minimum_transfers(start_object, end_object) for start_object, end_object in queries]
 
 
 class Tests(unittest.TestCase):
@@ -119,20 +356,129 @@ I)SAN"""
         g = OrbitGraph.create_graph_from_input_string(sample_input)
         min_transfers = g.get_minimum_transfers("YOU", "SAN")
         self.assertEqual(min_transfers, 4)
+        self.assertEqual(g.get_minimum_transfers("YOU", "L"), 0)
+        self.assertEqual(g.get_minimum_transfers("SAN", "H"), 4)
+
+    def test_compact_graph(self):
+        g = OrbitGraph.create_graph_from_input_string("B)C\nCOM)B\nB)G\nC)D")
+        self.assertEqual(g.names, ["B", "C", "COM", "G", "D"])
+        self.assertEqual(list(g.parents), [2, 0, -1, 0, 1])
+        self.assertEqual(list(g.get_children(g.ids["B"])), [1, 3])
+        self.assertEqual(list(g.topological_order()), [2, 0, 1, 3, 4])
+        self.assertEqual(list(g.compute_depths()), [1, 2, 0, 2, 3])
+        self.assertEqual(g.count_number_of_orbits(), 8)
+
+        g.add_edge("D", "E")
+        self.assertEqual(g.count_number_of_orbits(), 12)
+
+    def test_create_graph_from_file(self):
+        expected = OrbitGraph.create_graph_from_input_string(get_file_contents())
+        for chunk_size in (1, 7, 64, 1 << 20):
+            g = OrbitGraph.create_graph_from_file(get_file_path(), chunk_size)
+            self.assertEqual(g.names, expected.names)
+            self.assertEqual(g.parents, expected.parents)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "d6.txt")
+            with open(file_path, "wb") as f:
+                f.write(b"COM)B\r\nB)C\n\nC)D")
+            self.assertEqual(OrbitGraph.create_graph_from_file(file_path, 4).count_number_of_orbits(), 6)
+
+            with open(file_path, "wb") as f:
+                f.write(b"COM)B\nB\nC)D\n")
+            with self.assertRaises(ValueError):
+                OrbitGraph.create_graph_from_file(file_path)
+
+    def test_incremental_updates(self):
+        g = OrbitGraph.create_graph_from_input_string("COM)B\nB)C\nC)D\nB)G")
+        self.assertEqual(g.count_number_of_orbits(), 8)
+        self.assertEqual(g.get_subtree_size("B"), 4)
+
+        # Moving C with its subtree from B to G makes both one level deeper.
+        g.add_edge("G", "C")
+        self.assertEqual(g.count_number_of_orbits(), 10)
+        self.assertEqual(g.get_subtree_size("G"), 3)
+        self.assertEqual(g.get_subtree_size("B"), 4)
+
+        # G, C and D keep orbiting each other as a separate tree.
+        g.remove_edge("B", "G")
+        self.assertEqual(g.count_number_of_orbits(), 4)
+        self.assertEqual(g.get_subtree_size("COM"), 2)
+        with self.assertRaises(ValueError):
+            g.remove_edge("B", "G")
+        with self.assertRaises(ValueError):
+            g.add_edge("D", "G")
+
+        g.add_edge("COM", "G")
+        g.add_edge("D", "E")
+        self.assertEqual(g.count_number_of_orbits(), 11)
+
+        # A rejected move keeps the orbiter where it was.
+        g = OrbitGraph.create_graph_from_input_string("COM)B\nB)C\nC)D")
+        self.assertEqual(g.count_number_of_orbits(), 6)
+        with self.assertRaises(ValueError):
+            g.add_edge("D", "B")
+        self.assertEqual(g.count_number_of_orbits(), 6)
+        self.assertEqual(g.get_subtree_size("COM"), 4)
+
+        # Deep chains load without walking the ancestors of every new edge.
+        chain = ["COM"] + ["B{}".format(i) for i in range(40000)]
+        edges = ["{}){}".format(a, b) for a, b in zip(chain, chain[1:])]
+        for lines in (edges, edges[::-1]):
+            start = time.perf_counter()
+            g = OrbitGraph.create_graph_from_input_string("\n".join(lines))
+            self.assertLess(time.perf_counter() - start, 5)
+            self.assertEqual(g.count_number_of_orbits(), 40000 * 40001 // 2)
+
+        # Cycles are rejected before the first count as well.
+        with self.assertRaises(ValueError):
+            OrbitGraph.create_graph_from_input_string("COM)B\nB)C\nC)B")
+        with self.assertRaises(ValueError):
+            OrbitGraph.create_graph_from_input_string("B)B")
+
+        lines = get_file_contents().splitlines()
+        g = OrbitGraph.create_graph_from_input_string("\n".join(lines))
+        g.count_number_of_orbits()
+        for i in range(0, len(lines), 50):
+            central_object, orbiter = lines[i].split(")")
+            _, new_central_object = lines[(i * 7) % len(lines)].split(")")
+            parents = g.parents[:]
+            try:
+                g.add_edge(new_central_object, orbiter)
+            except ValueError:
+                self.assertEqual(g.parents, parents)
+            self.assertEqual(g.count_number_of_orbits(), sum(g.compute_depths()))
+            self.assertEqual(list(g.subtree_sizes), list(g.compute_subtree_sizes()))
+
+    def test_ancestor_index(self):
+        g = OrbitGraph.create_graph_from_input_string(get_file_contents() + "\nX)Y\nY)Z")
+        index = AncestorIndex(g)
+        self.assertEqual(index.get_minimum_transfers("YOU", "SAN"), 343)
+        self.assertEqual(index.get_minimum_transfers("Z", "SAN"), -1)
+        self.assertEqual(index.get_minimum_transfers("Z", "X"), 0)
+
+        names = g.names[::97] + ["YOU", "SAN"]
+        queries = [(a, b) for a in names for b in names]
+        self.assertEqual(index.get_minimum_transfers_batch(queries),
+                         [g.get_minimum_transfers(a, b) for a, b in queries])
+
+        g.add_edge("SAN", "NEW")
+        with self.assertRaises(ValueError):
+            index.get_minimum_transfers("NEW", "YOU")
+        index = AncestorIndex(g)
+        self.assertEqual(index.get_minimum_transfers("NEW", "YOU"), 344)
 
 
 def part1():
-    contents = get_file_contents()
-    g = OrbitGraph.create_graph_from_input_string(contents)
+    g = OrbitGraph.create_graph_from_file(get_file_path())
     count = g.count_number_of_orbits()
     print(count)
     assert count == 110190
 
 
 def part2():
-    contents = get_file_contents()
-    g = OrbitGraph.create_graph_from_input_string(contents)
-    count = g.get_minimum_transfers("YOU", "SAN")
+    g = OrbitGraph.create_graph_from_file(get_file_path())
+    count = AncestorIndex(g).get_minimum_transfers("YOU", "SAN")
     print(count)
     assert count == 343
 
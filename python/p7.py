@@ -5,6 +5,7 @@ import operator
 import typing
 import itertools
 import enum
+import concurrent.futures
 
 
 def get_file_contents() -> str:
@@ -256,6 +257,71 @@ def get_max_thruster_signal(input_program: str,
     return max_signal
 
 
+def clone_program(p: ProgramState) -> ProgramState:
+    return ProgramState.create(list(p.memory), p.ip, p.state)
+
+
+def create_phase_snapshots(input_program: str,
+                           phases: typing.Iterable[int]) -> typing.Dict[int, ProgramState]:
+    # Once an amplifier consumed its phase setting, its state only depends on
+    # that phase, so each phase is parsed and warmed up exactly once.
+    base_program = create_program_str(input_program)
+    snapshots = {}
+    for phase in phases:
+        p = clone_program(base_program)
+        output_values = []
+        resume_program(p, [phase], output_values)
+        if p.state != ProgramStateType.Interrupted or output_values:
+            raise RuntimeError("Amplifier with phase {} did not wait for a signal input.".format(phase))
+        snapshots[phase] = p
+    return snapshots
+
+
+def run_amplifiers_from_snapshots(snapshots: typing.Dict[int, ProgramState],
+                                  phases_list: typing.Sequence[int]) -> int:
+    last_signal_output = 0
+    amplifier_programs = [clone_program(snapshots[phase]) for phase in phases_list]
+    program_interrupted = True
+    while program_interrupted:
+        program_interrupted = False
+        for p in amplifier_programs:
+            output_values = []
+            resume_program(p, [last_signal_output], output_values)
+            if p.state == ProgramStateType.Interrupted:
+                program_interrupted = True
+            last_signal_output = output_values[0]
+    return last_signal_output
+
+
+_worker_snapshots: typing.Dict[int, ProgramState] = {}
+
+
+def _init_snapshot_worker(snapshots: typing.Dict[int, ProgramState]):
+    global _worker_snapshots
+    _worker_snapshots = snapshots
+
+
+def _run_permutation_in_worker(phases_list: typing.Tuple[int, ...]) -> int:
+    return run_amplifiers_from_snapshots(_worker_snapshots, phases_list)
+
+
+def get_max_thruster_signal_snapshots(input_program: str,
+                                      initial_phase_permutation: str,
+                                      processes: typing.Optional[int] = None) -> int:
+    phases = [int(e) for e in initial_phase_permutation]
+    snapshots = create_phase_snapshots(input_program, phases)
+    phase_permutations = itertools.permutations(phases)
+
+    if processes == 1:
+        return max(run_amplifiers_from_snapshots(snapshots, phase) for phase in phase_permutations)
+
+    # Snapshots are shipped to every worker once, instead of once per permutation.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                initializer=_init_snapshot_worker,
+                                                initargs=(snapshots,)) as executor:
+        return max(executor.map(_run_permutation_in_worker, phase_permutations, chunksize=8))
+
+
 class Tests(unittest.TestCase):
     def run_program_check_output(self: unittest.TestCase,
                                  input_program: str,
@@ -271,6 +337,8 @@ class Tests(unittest.TestCase):
                           initial_phase_permutation: str = "01234"):
         signal = get_max_thruster_signal(input_program, initial_phase_permutation)
         self.assertEqual(signal, max_thrust)
+        signal = get_max_thruster_signal_snapshots(input_program, initial_phase_permutation, processes=1)
+        self.assertEqual(signal, max_thrust)
 
     def test_samples(self):
         self.assertEqual(decode_instruction(1002), (2, [0, 1, 0]))
@@ -316,6 +384,11 @@ class Tests(unittest.TestCase):
                                18216,
                                initial_phase_permutation="56789")
 
+    def test_snapshots_parallel(self):
+        input_program = "3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5"
+        signal = get_max_thruster_signal_snapshots(input_program, "56789", processes=2)
+        self.assertEqual(signal, 139629729)
+
 
 def part1():
     input_program = get_file_contents()
@@ -326,7 +399,7 @@ def part1():
 
 def part2():
     input_program = get_file_contents()
-    max_signal = get_max_thruster_signal(input_program, initial_phase_permutation="56789")
+    max_signal = get_max_thruster_signal_snapshots(input_program, initial_phase_permutation="56789")
     print(max_signal)
     assert max_signal == 8754464
 
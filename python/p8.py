@@ -2,11 +2,22 @@ import unittest
 import os
 import typing
 import collections
+import mmap
+import tempfile
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def get_file_contents() -> str:
+
+def get_file_path() -> str:
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    file_path = os.path.join(dir_path, "..", "data", "d8.txt")
+    return os.path.join(dir_path, "..", "data", "d8.txt")
+
+
+def get_file_contents() -> str:
+    file_path = get_file_path()
     with open(file_path, "r") as f:
         lines = f.readlines()
         lines = [l.strip() for l in lines]
@@ -57,6 +68,86 @@ def render_image(d: str, width: int, height: int) -> typing.List[int]:
     return rendered_image
 
 
+def digits_to_layer_array(d: typing.Union[str, bytes], width: int, height: int):
+    # (layers, height, width) uint8 view of the digit characters.
+    if isinstance(d, str):
+        d = d.encode()
+    digits = np.frombuffer(d, dtype=np.uint8) - ord("0")
+    return digits.reshape(-1, height, width)
+
+
+def layer_digit_counts(layers) -> typing.Any:
+    # counts[layer, digit] for the digits 0 to 9.
+    layer_count = layers.shape[0]
+    flat = layers.reshape(layer_count, -1).astype(np.intp)
+    offsets = np.arange(layer_count, dtype=np.intp)[:, np.newaxis] * 10
+    return np.bincount((flat + offsets).ravel(), minlength=layer_count * 10).reshape(layer_count, 10)
+
+
+def image_checksum_numpy(d: typing.Union[str, bytes], width: int, height: int) -> int:
+    counts = layer_digit_counts(digits_to_layer_array(d, width, height))
+    min_layer = int(np.argmin(counts[:, 0]))
+    return int(counts[min_layer, 1]) * int(counts[min_layer, 2])
+
+
+def render_image_numpy(d: typing.Union[str, bytes], width: int, height: int) -> typing.List[int]:
+    layers = digits_to_layer_array(d, width, height)
+    # argmax finds the first non-transparent layer for every pixel. A pixel
+    # transparent on all layers stays transparent, like render_pixel.
+    front_layer = np.argmax(layers != 2, axis=0)
+    image = np.take_along_axis(layers, front_layer[np.newaxis], axis=0)[0]
+    return image.ravel().tolist()
+
+
+def decode_image_file(file_path: str,
+                      width: int,
+                      height: int,
+                      checksum: bool = True) -> typing.Tuple[typing.Optional[int], typing.List[int]]:
+    # Memory-maps the image and visits it one layer at a time, keeping only
+    # the composite rendered so far and the best checksum. The checksum
+    # needs every layer; without it, reading stops at the first depth where
+    # no pixel is transparent anymore.
+    size = width * height
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses empty files, there are no layers to decode.
+            return None, [2] * size
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            return _decode_image_layers(image, size, checksum)
+
+
+def _decode_image_layers(image: mmap.mmap,
+                         size: int,
+                         checksum: bool) -> typing.Tuple[typing.Optional[int], typing.List[int]]:
+    digit_count = len(image)
+    while digit_count and image[digit_count - 1:digit_count].isspace():
+        digit_count -= 1
+    if digit_count % size:
+        raise ValueError("Image ends with a partial layer of {} digits.".format(digit_count % size))
+
+    composite = np.full(size, 2, dtype=np.uint8)
+    resolved = False
+    min_zeros = None
+    best_checksum = None
+    for start in range(0, digit_count, size):
+        layer = image[start:start + size]
+        if checksum:
+            zeros = layer.count(b"0")
+            if min_zeros is None or zeros < min_zeros:
+                min_zeros = zeros
+                best_checksum = layer.count(b"1") * layer.count(b"2")
+        elif resolved:
+            break
+
+        if not resolved:
+            transparent = composite == 2
+            digits = np.frombuffer(layer, dtype=np.uint8) - ord("0")
+            composite[transparent] = digits[transparent]
+            resolved = not (composite == 2).any()
+
+    return best_checksum, composite.tolist()
+
+
 def part1():
     checksum = image_checksum(get_file_contents(), 25, 6)
     print(checksum)
@@ -85,6 +176,44 @@ class Tests(unittest.TestCase):
 
         self.assertEqual(render_image("0222112222120000", 2, 2), [0, 1, 1, 0])
 
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_numpy(self):
+        self.assertEqual(image_checksum_numpy("123456789012", 3, 2), 1)
+        self.assertEqual(render_image_numpy("0222112222120000", 2, 2), [0, 1, 1, 0])
+        self.assertEqual(render_image_numpy("2222", 2, 1), [2, 2])
+        self.assertEqual(layer_digit_counts(digits_to_layer_array("0012", 2, 1)).tolist(),
+                         [[2, 0, 0, 0, 0, 0, 0, 0, 0, 0], [0, 1, 1, 0, 0, 0, 0, 0, 0, 0]])
+
+        contents = get_file_contents()
+        self.assertEqual(image_checksum_numpy(contents, 25, 6), image_checksum(contents, 25, 6))
+        self.assertEqual(render_image_numpy(contents, 25, 6), render_image(contents, 25, 6))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_decode_image_file(self):
+        contents = get_file_contents()
+        checksum, image = decode_image_file(get_file_path(), 25, 6)
+        self.assertEqual(checksum, image_checksum(contents, 25, 6))
+        self.assertEqual(image, render_image(contents, 25, 6))
+        self.assertEqual(decode_image_file(get_file_path(), 25, 6, checksum=False), (None, image))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "d8.txt")
+            with open(file_path, "w") as f:
+                f.write("0222112222120000\n")
+            self.assertEqual(decode_image_file(file_path, 2, 2), (4, [0, 1, 1, 0]))
+            # The third layer resolves everything, the fourth is never read.
+            with open(file_path, "w") as f:
+                f.write("0222112222109999")
+            self.assertEqual(decode_image_file(file_path, 2, 2, checksum=False), (None, [0, 1, 1, 0]))
+
+            with open(file_path, "w") as f:
+                f.write("022211222\n")
+            with self.assertRaises(ValueError):
+                decode_image_file(file_path, 2, 2)
+            with open(file_path, "w"):
+                pass
+            self.assertEqual(decode_image_file(file_path, 2, 2), (None, [2, 2, 2, 2]))
+
 
 if __name__ == '__main__':
     part1()
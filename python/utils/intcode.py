@@ -4,12 +4,24 @@ import typing
 import enum
 import collections
 import unittest
+import time
+import array
+import copy
+import itertools
+
+
+Memory = typing.Union[typing.Dict[int, int], array.array]
 
 
 def get_int_code_instructions(line: str) -> typing.Dict[int, int]:
     return collections.defaultdict(int, {i: int(x) for i, x in enumerate(line.strip().split(","))})
 
 
+def get_int64_code_instructions(line: str) -> array.array:
+    # Raises OverflowError when a value does not fit into 64 bits.
+    return array.array("q", [int(x) for x in line.strip().split(",")])
+
+
 class Operation(enum.IntEnum):
     Halt = 99
     Add = 1
@@ -122,7 +134,7 @@ class ProgramState(object):
         return s
 
     @staticmethod
-    def create(memory: typing.Dict[int, int],
+    def create(memory: Memory,
                ip: int,
                relative_base: int = 0,
                state_type: ProgramStateType = ProgramStateType.Created):
@@ -142,7 +154,7 @@ class ProgramState(object):
         self._state_type = value
 
     @property
-    def memory(self) -> typing.Dict[int, int]:
+    def memory(self) -> Memory:
         return self._memory
 
     @memory.setter
@@ -166,6 +178,45 @@ class ProgramState(object):
         self._relative_base = value
 
 
+SPARSE_WRITE_DISTANCE = 4096
+
+
+def promote_memory(p: ProgramState):
+    # Switches a machine from the fixed-width int64 memory to the bigint one.
+    if isinstance(p.memory, array.array):
+        p.memory = collections.defaultdict(int, enumerate(p.memory))
+
+
+def load(p: ProgramState, address: int) -> int:
+    if address < 0:
+        promote_memory(p)
+    try:
+        return p.memory[address]
+    except IndexError:
+        # Reading past the end of int64 memory, same as an untouched dict entry.
+        return 0
+
+
+def store(p: ProgramState, address: int, value: int):
+    if address < 0:
+        promote_memory(p)
+    try:
+        p.memory[address] = value
+    except IndexError:
+        memory = p.memory
+        if address > 2 * len(memory) + SPARSE_WRITE_DISTANCE:
+            # Padding the array up to a far address would allocate all the
+            # cells in between, the dict only stores the written one.
+            promote_memory(p)
+            p.memory[address] = value
+            return
+        memory.frombytes(bytes(memory.itemsize * max(address + 1 - len(memory), len(memory))))
+        store(p, address, value)
+    except OverflowError:
+        promote_memory(p)
+        p.memory[address] = value
+
+
 class ParameterMode(enum.IntEnum):
     Position = 0
     Immediate = 1
@@ -176,11 +227,11 @@ def read_memory_value(p: ProgramState,
                       value: int,
                       mode: int) -> int:
     if mode == ParameterMode.Position:
-        return p.memory[value]
+        return load(p, value)
     elif mode == ParameterMode.Immediate:
         return value
     elif mode == ParameterMode.RelativeToBase:
-        return p.memory[p.relative_base + value]
+        return load(p, p.relative_base + value)
     raise RuntimeError("Invalid read parameter mode: {}.".format(mode))
 
 
@@ -205,7 +256,7 @@ def get_params(p: ProgramState,
                p_modes: typing.List[int],
                ) -> typing.List[int]:
     params = [param_type_to_function[operation_param_types[op][i]](p,
-                                                                   p.memory[p.ip + 1 + i],
+                                                                   load(p, p.ip + 1 + i),
                                                                    p_mode)
               for i, p_mode in enumerate(p_modes)]
     return params
@@ -215,14 +266,14 @@ def run_instruction(p: ProgramState,
                     input_values: typing.List[int],
                     output_values: typing.List[int]
                     ) -> InstructionResult:
-    instruction = p.memory[p.ip]
+    instruction = load(p, p.ip)
     op, p_modes = decode_instruction(instruction)
 
     if op == Operation.Halt:  # Halt
         return InstructionResult.halt()
     elif op == Operation.Add or op == Operation.Multiply:  # Add or multiply x, y into z
         input_1, input_2, output_address = get_params(p, op, p_modes)
-        p.memory[output_address] = functools.reduce(operators[op], [input_1, input_2])
+        store(p, output_address, functools.reduce(operators[op], [input_1, input_2]))
         return InstructionResult.advance_ip(4)
     elif op == Operation.Input:  # Input into x
         # No input values, interrupt program, save state, allow to resume
@@ -230,7 +281,7 @@ def run_instruction(p: ProgramState,
         if not input_values:
             return InstructionResult.interrupt()
         output_address, = get_params(p, op, p_modes)
-        p.memory[output_address] = input_values.pop(0)
+        store(p, output_address, input_values.pop(0))
         return InstructionResult.advance_ip(2)
     elif op == Operation.Output:  # Output into x
         output_value, = get_params(p, op, p_modes)
@@ -246,9 +297,9 @@ def run_instruction(p: ProgramState,
         input_1, input_2, output_address = get_params(p, op, p_modes)
 
         if operators[op](input_1, input_2):
-            p.memory[output_address] = 1
+            store(p, output_address, 1)
         else:
-            p.memory[output_address] = 0
+            store(p, output_address, 0)
         return InstructionResult.advance_ip(4)
     elif op == Operation.AdjustRelativeBase:  # Adjust relative base by + x
         input_1, = get_params(p, op, p_modes)
@@ -284,23 +335,81 @@ def resume_program(p: ProgramState,
     return p
 
 
-def create_program_str(input_program: str) -> ProgramState:
-    memory = get_int_code_instructions(input_program)
+def resume_program_coroutine(p: ProgramState,
+                             max_steps: typing.Optional[int] = None
+                             ) -> typing.Generator[typing.Optional[int], typing.Optional[int], ProgramState]:
+    # Yields each output value, and None whenever an input value is needed.
+    # Values sent in response to either kind of yield are queued as inputs in
+    # the order they were sent, so a controller can answer an output with its
+    # next command. With max_steps set, executing more instructions than that
+    # raises a RuntimeError.
+    input_values = []
+    output_values = []
+    steps = 0
+
+    p.state = ProgramStateType.Running
+    while p.ip < len(p.memory):
+        if load(p, p.ip) % 100 == Operation.Input and not input_values:
+            while not input_values:
+                p.state = ProgramStateType.Interrupted
+                sent_input = yield None
+                p.state = ProgramStateType.Running
+                if sent_input is not None:
+                    input_values.append(sent_input)
+
+        if max_steps is not None:
+            steps += 1
+            if steps > max_steps:
+                raise RuntimeError("Step limit of {} instructions exceeded.".format(max_steps))
+        result = run_instruction(p, input_values, output_values)
+        result_type = result.type()
+        if result_type == InstructionResultType.AdvanceIP:
+            p.ip += result.value()
+        elif result_type == InstructionResultType.Halt:
+            p.state = ProgramStateType.Halted
+            break
+
+        if output_values:
+            p.state = ProgramStateType.Interrupted
+            sent_input = yield output_values.pop()
+            p.state = ProgramStateType.Running
+            if sent_input is not None:
+                input_values.append(sent_input)
+
+    return p
+
+
+def clone_program(p: ProgramState) -> ProgramState:
+    return ProgramState.create(copy.copy(p.memory), p.ip, p.relative_base, p.state)
+
+
+def create_program_str(input_program: str, int64_memory: bool = True) -> ProgramState:
+    # Machines start on int64 memory and get promoted to the bigint dict as
+    # soon as a stored value no longer fits.
+    memory = None
+    if int64_memory:
+        try:
+            memory = get_int64_code_instructions(input_program)
+        except OverflowError:
+            pass
+    if memory is None:
+        memory = get_int_code_instructions(input_program)
     p = ProgramState.create(memory, 0)
     return p
 
 
 def run_program_str(input_program: str,
                     input_values: typing.List[int],
-                    output_values: typing.List[int]
+                    output_values: typing.List[int],
+                    int64_memory: bool = True
                     ) -> ProgramState:
-    p = create_program_str(input_program)
+    p = create_program_str(input_program, int64_memory)
     return resume_program(p, input_values, output_values)
 
 
 class VM(object):
-    def __init__(self, input_program: str):
-        self._program = create_program_str(input_program)
+    def __init__(self, input_program: str, int64_memory: bool = True):
+        self._program = create_program_str(input_program, int64_memory)
         self._input_values = []
         self._output_values = []
 
@@ -316,8 +425,11 @@ class VM(object):
         resume_program(self._program, self._input_values, self._output_values)
         return self.output()
 
+    def coroutine(self) -> typing.Generator[typing.Optional[int], typing.Optional[int], ProgramState]:
+        return resume_program_coroutine(self._program)
+
     def write_memory(self, i: int, value: int):
-        self._program.memory[i] = value
+        store(self._program, i, value)
 
     def output(self):
         return self._output_values
@@ -335,14 +447,37 @@ class VM(object):
         return self._program
 
 
+def measure_interaction_latency(interactions: int = 100000) -> typing.Tuple[float, float]:
+    # Echo loop: read a value, output it, jump back to the start.
+    echo_program = "3,100,4,100,1105,1,0"
+
+    vm = VM(echo_program)
+    vm.run()
+    start = time.perf_counter()
+    for i in range(interactions):
+        vm.resume([i])
+    resume_latency = (time.perf_counter() - start) / interactions
+
+    vm = VM(echo_program)
+    echo = vm.coroutine()
+    next(echo)
+    start = time.perf_counter()
+    for i in range(interactions):
+        echo.send(i)
+    coroutine_latency = (time.perf_counter() - start) / interactions
+
+    return resume_latency, coroutine_latency
+
+
 class Tests(unittest.TestCase):
     def run_program_check_output(self: unittest.TestCase,
                                  input_program: str,
                                  input_values: typing.List[int],
                                  expected_output_values: typing.List[int]):
-        output_values = []
-        run_program_str(input_program, input_values, output_values)
-        self.assertEqual(output_values, expected_output_values)
+        for int64_memory in (True, False):
+            output_values = []
+            run_program_str(input_program, list(input_values), output_values, int64_memory)
+            self.assertEqual(output_values, expected_output_values)
 
     def test_samples(self):
         self.assertEqual(decode_instruction(1002), (2, [0, 1, 0]))
@@ -387,6 +522,76 @@ class Tests(unittest.TestCase):
                                       [],
                                       [1125899906842624])
 
+    def test_int64_overflow_promotion(self):
+        p = create_program_str("1102,34915192,34915192,7,4,7,99,0")
+        self.assertIsInstance(p.memory, array.array)
+        output_values = []
+        resume_program(p, [], output_values)
+        self.assertEqual(output_values, [1219070632396864])
+        self.assertIsInstance(p.memory, array.array)
+
+        # (2^62)^2 does not fit, the machine continues on bigint memory.
+        p = create_program_str("1102,4611686018427387904,4611686018427387904,11,1001,11,1,11,4,11,99,0")
+        output_values = []
+        resume_program(p, [], output_values)
+        self.assertEqual(output_values, [2 ** 124 + 1])
+        self.assertNotIsInstance(p.memory, array.array)
+
+        p = create_program_str("104,36893488147419103232,99")
+        self.assertNotIsInstance(p.memory, array.array)
+
+        # Writes past the end grow the memory, reads past the end are zero.
+        self.run_program_check_output("1101,2,3,1000,4,1000,4,2000,99", [], [5, 0])
+
+        # Far writes switch to bigint memory instead of padding the array.
+        p = create_program_str("1101,1,1,10000000,4,10000000,99")
+        output_values = []
+        resume_program(p, [], output_values)
+        self.assertEqual(output_values, [2])
+        self.assertNotIsInstance(p.memory, array.array)
+        self.assertLess(len(p.memory), 100)
+        self.run_program_check_output("1101,1,1,10000000000,4,10000000000,99", [], [2])
+
+    def test_coroutine(self):
+        # Outputs the sum of two inputs, then halts.
+        vm = VM("3,11,3,12,1,11,12,13,4,13,99,0,0,0")
+        adder = vm.coroutine()
+        self.assertIsNone(next(adder))
+        self.assertIsNone(adder.send(2))
+        self.assertEqual(adder.send(3), 5)
+        self.assertFalse(vm.halted())
+        with self.assertRaises(StopIteration):
+            next(adder)
+        self.assertTrue(vm.halted())
+
+        vm = VM("3,100,4,100,1105,1,0")
+        echo = vm.coroutine()
+        next(echo)
+        self.assertEqual([echo.send(i) for i in range(5)], list(range(5)))
+        self.assertTrue(vm.interrupted())
+
+        # Values sent to output yields wait for the next input instruction.
+        vm = VM("104,1,104,2,3,20,4,20,99")
+        machine = vm.coroutine()
+        self.assertEqual(next(machine), 1)
+        self.assertEqual(machine.send(7), 2)
+        self.assertEqual(next(machine), 7)
+
+        vm = VM("104,1,104,2,3,20,3,21,1,20,21,22,4,22,99")
+        machine = vm.coroutine()
+        self.assertEqual(next(machine), 1)
+        self.assertEqual(machine.send(7), 2)
+        self.assertEqual(machine.send(8), 15)
+
+        machine = resume_program_coroutine(create_program_str("104,1,1105,1,0"), max_steps=5)
+        self.assertEqual(list(itertools.islice(machine, 3)), [1, 1, 1])
+        with self.assertRaises(RuntimeError):
+            next(machine)
+
+        vm = VM("109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99")
+        self.assertEqual(list(vm.coroutine()),
+                         [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,350 @@
+import os
+import sys
+import stat
+import json
+import collections
+import time
+import socket
+import typing
+import argparse
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+try:
+    from python.utils.intcode import ProgramState, create_program_str, clone_program, resume_program_coroutine, store
+except ImportError:
+    try:
+        from utils.intcode import ProgramState, create_program_str, clone_program, resume_program_coroutine, store
+    except ImportError:
+        from intcode import ProgramState, create_program_str, clone_program, resume_program_coroutine, store
+
+# Protocol: one JSON object per line in both directions.
+#
+# Job:   {"program": "d9", "inputs": [2], "patches": {"1": 12}}
+#        "program" names a data file (data/d9.txt); "source" may carry the
+#        program text instead.
+# Reply: {"output": 73144} for every output value as soon as it is produced,
+#        then {"state": "Halted"} or {"state": "Interrupted"} when the machine
+#        waits for more input than the job provided, or {"error": "..."}.
+#        Jobs running more than the server's step limit end with an error, so
+#        a machine that never halts can't hold a worker forever.
+
+DEFAULT_MAX_STEPS = 10 ** 8
+
+
+def get_program_file_contents(name: str) -> str:
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    file_path = os.path.join(dir_path, "..", "..", "data", "{}.txt".format(os.path.basename(name)))
+    with open(file_path, "r") as f:
+        lines = f.readlines()
+        lines = [l.strip() for l in lines]
+    return lines[0]
+
+
+class ProgramCache(object):
+    # Parsed programs stay in memory for the lifetime of a worker; jobs only
+    # pay for a memory copy. Named data files are few and always kept, while
+    # programs sent as source are held in an LRU of at most max_sources.
+    def __init__(self, max_sources: int = 64):
+        self.programs: typing.Dict[str, ProgramState] = {}
+        self.sources: typing.OrderedDict[str, ProgramState] = collections.OrderedDict()
+        self.max_sources = max_sources
+
+    def get(self, job: typing.Dict[str, typing.Any]) -> ProgramState:
+        if "source" in job:
+            source = job["source"]
+            p = self.sources.get(source)
+            if p is None:
+                p = create_program_str(source)
+                self.sources[source] = p
+                if len(self.sources) > self.max_sources:
+                    self.sources.popitem(last=False)
+            else:
+                self.sources.move_to_end(source)
+        else:
+            name = job["program"]
+            p = self.programs.get(name)
+            if p is None:
+                p = create_program_str(get_program_file_contents(name))
+                self.programs[name] = p
+        return clone_program(p)
+
+
+def run_job(cache: ProgramCache,
+            job: typing.Dict[str, typing.Any],
+            max_steps: typing.Optional[int] = DEFAULT_MAX_STEPS) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    p = cache.get(job)
+    for address, value in job.get("patches", {}).items():
+        store(p, int(address), value)
+
+    inputs = iter(job.get("inputs", []))
+    machine = resume_program_coroutine(p, max_steps)
+    try:
+        value = next(machine)
+        while True:
+            if value is None:
+                next_input = next(inputs, None)
+                if next_input is None:
+                    break
+                value = machine.send(next_input)
+            else:
+                yield {"output": value}
+                value = next(machine)
+    except StopIteration:
+        pass
+    yield {"state": p.state.name}
+
+
+def handle_connection(cache: ProgramCache,
+                      conn: socket.socket,
+                      max_steps: typing.Optional[int] = DEFAULT_MAX_STEPS):
+    with conn, conn.makefile("rb") as reader, conn.makefile("wb") as writer:
+        for line in reader:
+            try:
+                for reply in run_job(cache, json.loads(line), max_steps):
+                    writer.write(json.dumps(reply).encode() + b"\n")
+                    writer.flush()
+            except Exception as e:
+                writer.write(json.dumps({"error": str(e)}).encode() + b"\n")
+                writer.flush()
+
+
+def worker_loop(listener: socket.socket, cache: ProgramCache, max_steps: typing.Optional[int]):
+    while True:
+        conn, _ = listener.accept()
+        try:
+            handle_connection(cache, conn, max_steps)
+        except OSError:
+            pass
+
+
+def create_listener(address: str) -> socket.socket:
+    # "host:port" listens on TCP, anything else is a Unix socket path.
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, int(port)))
+    else:
+        # Only a stale socket left by a previous server is replaced.
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise FileExistsError("{} exists and is not a socket.".format(address))
+            os.unlink(address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+    listener.listen(128)
+    return listener
+
+
+def start_workers(address: str,
+                  worker_count: int,
+                  preload: typing.Sequence[str] = (),
+                  max_steps: typing.Optional[int] = DEFAULT_MAX_STEPS
+                  ) -> typing.Tuple[socket.socket, typing.List[multiprocessing.Process]]:
+    listener = create_listener(address)
+    # Programs parsed before forking are shared by all workers.
+    cache = ProgramCache()
+    for name in preload:
+        cache.get({"program": name})
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=worker_loop, args=(listener, cache, max_steps), daemon=True)
+               for _ in range(worker_count)]
+    for w in workers:
+        w.start()
+    return listener, workers
+
+
+def stop_workers(listener: socket.socket, workers: typing.List[multiprocessing.Process]):
+    for w in workers:
+        w.terminate()
+    for w in workers:
+        w.join()
+    if listener.family == socket.AF_UNIX:
+        address = listener.getsockname()
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+    else:
+        listener.close()
+
+
+def serve(address: str,
+          worker_count: int,
+          preload: typing.Sequence[str] = (),
+          max_steps: typing.Optional[int] = DEFAULT_MAX_STEPS):
+    listener, workers = start_workers(address, worker_count, preload, max_steps)
+    print("Serving on {} with {} workers".format(address, worker_count))
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(listener, workers)
+
+
+class Client(object):
+    def __init__(self, address: str):
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            self._conn = socket.create_connection((host, int(port)))
+        else:
+            self._conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._conn.connect(address)
+        self._reader = self._conn.makefile("rb")
+        self._writer = self._conn.makefile("wb")
+
+    def stream(self, job: typing.Dict[str, typing.Any]) -> typing.Iterator[int]:
+        self._writer.write(json.dumps(job).encode() + b"\n")
+        self._writer.flush()
+        for line in self._reader:
+            reply = json.loads(line)
+            if "output" in reply:
+                yield reply["output"]
+            elif "error" in reply:
+                raise RuntimeError(reply["error"])
+            else:
+                return
+
+    def run(self, job: typing.Dict[str, typing.Any]) -> typing.List[int]:
+        return list(self.stream(job))
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+        self._conn.close()
+
+
+def percentile(sorted_values: typing.List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def generate_load(address: str,
+                  job: typing.Dict[str, typing.Any],
+                  job_count: int,
+                  concurrency: int) -> typing.Dict[str, float]:
+    latencies = []
+    latencies_lock = threading.Lock()
+    jobs_per_client = [job_count // concurrency + (1 if i < job_count % concurrency else 0)
+                       for i in range(concurrency)]
+
+    def client_loop(count: int):
+        client = Client(address)
+        client_latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            client.run(job)
+            client_latencies.append(time.perf_counter() - start)
+        client.close()
+        with latencies_lock:
+            latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=client_loop, args=(count,)) for count in jobs_per_client]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "jobs": len(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "jobs_per_second": len(latencies) / elapsed,
+    }
+
+
+class Tests(unittest.TestCase):
+    def test_run_job(self):
+        cache = ProgramCache()
+        replies = list(run_job(cache, {"source": "3,0,4,0,99", "inputs": [12]}))
+        self.assertEqual(replies, [{"output": 12}, {"state": "Halted"}])
+
+        replies = list(run_job(cache, {"source": "3,0,4,0,3,0,99", "inputs": [7]}))
+        self.assertEqual(replies, [{"output": 7}, {"state": "Interrupted"}])
+
+        replies = list(run_job(cache, {"source": "1,0,0,0,4,0,99", "patches": {"1": 4}}))
+        self.assertEqual(replies, [{"output": 5}, {"state": "Halted"}])
+        self.assertEqual(len(cache.sources), 3)
+
+        # Source programs are evicted least recently used first.
+        cache = ProgramCache(max_sources=2)
+        for source in ("104,1,99", "104,2,99", "104,1,99", "104,3,99"):
+            self.assertEqual(list(run_job(cache, {"source": source}))[0], {"output": int(source[4])})
+        self.assertEqual(list(cache.sources), ["104,1,99", "104,3,99"])
+
+    def test_server(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            address = os.path.join(temp_dir, "intcode.sock")
+            listener, workers = start_workers(address, 2, max_steps=10000)
+            try:
+                client = Client(address)
+                self.assertEqual(client.run({"source": "3,0,4,0,99", "inputs": [42]}), [42])
+                with self.assertRaises(RuntimeError):
+                    client.run({"source": "98,0,0"})
+                self.assertEqual(client.run({"source": "104,1125899906842624,99"}), [1125899906842624])
+                # Non-halting jobs are stopped and the worker stays available.
+                for _ in range(3):
+                    with self.assertRaises(RuntimeError):
+                        client.run({"source": "1105,1,0"})
+                self.assertEqual(client.run({"source": "3,0,4,0,99", "inputs": [5]}), [5])
+                client.close()
+
+                stats = generate_load(address, {"source": "3,0,4,0,99", "inputs": [1]}, 20, 4)
+                self.assertEqual(stats["jobs"], 20)
+            finally:
+                stop_workers(listener, workers)
+
+            # A stale socket is replaced, any other file is left alone.
+            listener = create_listener(address)
+            listener.close()
+            listener = create_listener(address)
+            listener.close()
+
+            file_path = os.path.join(temp_dir, "notes.txt")
+            with open(file_path, "w") as f:
+                f.write("keep")
+            with self.assertRaises(FileExistsError):
+                create_listener(file_path)
+            with open(file_path, "r") as f:
+                self.assertEqual(f.read(), "keep")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intcode job server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("address", help="Unix socket path or host:port")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--preload", nargs="*", default=[], help="Data file names, e.g. d9")
+    serve_parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS,
+                              help="Instructions a job may execute before it is stopped")
+
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("address", help="Unix socket path or host:port")
+    bench_parser.add_argument("--job", default='{"program": "d9", "inputs": [1]}')
+    bench_parser.add_argument("--jobs", type=int, default=1000)
+    bench_parser.add_argument("--concurrency", type=int, default=8)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.address, args.workers, args.preload, args.max_steps)
+    else:
+        stats = generate_load(args.address, json.loads(args.job), args.jobs, args.concurrency)
+        print("jobs: {jobs} p50: {p50_ms:.3f} ms p99: {p99_ms:.3f} ms throughput: {jobs_per_second:.1f} jobs/s"
+              .format(**stats))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main()
+    else:
+        unittest.main()